@@ -1,24 +1,808 @@
-import tkinter as tk
-from tkinter import ttk, messagebox
-from typing import List, Dict, Tuple
-import json
-import random
-from datetime import datetime
+import argparse
 import csv
+import json
+import os
+import sys
+from typing import List, Dict, Tuple, Sequence, Callable, Iterable
+from datetime import datetime, timedelta
+from collections import OrderedDict, abc, deque
+from functools import lru_cache
+import hashlib
+import heapq
+from itertools import combinations_with_replacement
+import re
+import threading
+import time
+import warnings
+import numpy as np
+from foodcache import CacheFormatError, read_columns, write_columns
+from foodsearch import FoodSearchIndex
+from history import (HistoryBackend, CSVHistoryBackend, HistoryWriter, NullHistoryBackend,
+                     NutritionRollups, RollupHistory, open_history)
 
 class FoodItem:
+    """One food of the database; immutable once created.
+
+    Slotted to avoid a per-instance ``__dict__``. Category, portion and
+    flag strings are interned so items share them, and the dietary flags
+    are a frozenset.
+    """
+
+    __slots__ = ("name", "calories", "protein", "carbs", "fats", "category", "portion",
+                 "dietary_flags")
+
     def __init__(self, name: str, calories: int, protein: float, carbs: float, 
-                 fats: float, category: str, portion: str, dietary_flags: List[str]):
-        self.name = name
-        self.calories = calories
-        self.protein = protein
-        self.carbs = carbs
-        self.fats = fats
-        self.category = category
-        self.portion = portion
-        self.dietary_flags = dietary_flags  # e.g., ['vegan', 'gluten-free']
+                 fats: float, category: str, portion: str, dietary_flags: Iterable[str]):
+        set_field = super().__setattr__
+        set_field("name", name)
+        set_field("calories", calories)
+        set_field("protein", protein)
+        set_field("carbs", carbs)
+        set_field("fats", fats)
+        set_field("category", sys.intern(category))
+        set_field("portion", sys.intern(portion))
+        set_field("dietary_flags", _intern_flags(dietary_flags))  # e.g., {'vegan', 'gluten-free'}
+
+    def __setattr__(self, name, value):
+        raise AttributeError("FoodItem is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError("FoodItem is immutable")
+
+    def __reduce__(self):
+        return FoodItem, tuple(getattr(self, field) for field in self.__slots__)
+
+    def __repr__(self) -> str:
+        return f"FoodItem({self.name!r}, {self.category!r}, {self.portion!r})"
+
+# Most foods share a handful of flag combinations; keep one frozenset per combination
+_flag_sets = {}
+
+def _intern_flags(flags: Iterable[str]) -> frozenset:
+    key = frozenset(flags)
+    shared = _flag_sets.get(key)
+    if shared is None:
+        shared = _flag_sets[key] = frozenset(sys.intern(flag) for flag in key)
+    return shared
+
+class LRUCache:
+    """Bounded least-recently-used cache with hit and miss counters."""
+
+    def __init__(self, maxsize: int = 128):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        """Return the cached value for key, marking it most recently used."""
+        try:
+            value = self._entries[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        """Store a value, evicting the least recently used entry when full."""
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key=None):
+        """Drop one entry, or every entry when no key is given."""
+        if key is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(key, None)
+
+    def info(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses,
+                "size": len(self._entries), "maxsize": self.maxsize}
+
+@lru_cache(maxsize=256)
+def compile_allergens(allergens: Tuple[str, ...]) -> re.Pattern:
+    """Compile a normalized allergy list into one UTF-8 alternation pattern."""
+    return re.compile(b"|".join(re.escape(allergen.encode()) for allergen in allergens))
+
+def normalize_allergens(allergies: List[str]) -> Tuple[str, ...]:
+    """Normalize an allergy list into a hashable cache key."""
+    return tuple(sorted({allergen.lower() for allergen in allergies}))
+
+def restriction_key(restrictions: List[str], allergies: List[str]) -> Tuple[frozenset, Tuple[str, ...]]:
+    """Return a hashable key identifying a restriction and allergy combination."""
+    return (frozenset(restriction.lower() for restriction in restrictions),
+            normalize_allergens(allergies))
+
+class StringColumn(abc.Sequence):
+    """Read-only sequence of strings stored as one newline-terminated UTF-8 blob.
+
+    String ``i`` occupies ``blob[offsets[i]:offsets[i + 1] - 1]``. Strings
+    are decoded on access, so the blob may be a memory-mapped cache column.
+    """
+
+    def __init__(self, blob: np.ndarray, offsets: np.ndarray):
+        self.blob = blob
+        self.offsets = offsets
+
+    @classmethod
+    def from_strings(cls, strings: Sequence[str]) -> "StringColumn":
+        encoded = [string.encode() + b"\n" for string in strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(item) for item in encoded], out=offsets[1:])
+        return cls(np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        i = range(len(self))[i]
+        return self.blob[self.offsets[i]:self.offsets[i + 1] - 1].tobytes().decode()
+
+class FoodTable:
+    """Columnar, NumPy-backed view of a food database.
+
+    Nutrients are stored as one contiguous float row per macro so meal and
+    day totals are a single gather plus a reduction. Meals are index arrays
+    into the table. A table is built from FoodItem objects or memory-mapped
+    from a binary cache written by ``save_cache``; FoodItem objects for a
+    cached table are only created if ``foods`` is used.
+    """
+
+    NUTRIENTS = ("calories", "protein", "carbs", "fats")
+    # Columns stored in the binary cache, besides the string column parts
+    CACHE_COLUMNS = ("nutrients", "category_codes", "flag_masks")
+    STRING_COLUMNS = ("names", "normalized_names", "portions")
+
+    def __init__(self, foods: List[FoodItem]):
+        # Integer-coded categories
+        categories = list(dict.fromkeys(food.category for food in foods))
+        category_codes = {category: code for code, category in enumerate(categories)}
+
+        # Dietary flags as one bit per distinct (lower-cased) flag, in as many
+        # 64-bit words per food as the flags need
+        flag_bits = {}
+        flag_masks = []
+        for food in foods:
+            mask = 0
+            # Sorted so bit numbers do not depend on set iteration order
+            for flag in sorted(food.dietary_flags):
+                flag = flag.lower()
+                if flag not in flag_bits:
+                    flag_bits[flag] = len(flag_bits)
+                mask |= 1 << flag_bits[flag]
+            flag_masks.append(mask)
+        words = max(1, -(-len(flag_bits) // 64))
+        flag_masks = [[mask >> (64 * word) & 0xFFFFFFFFFFFFFFFF for word in range(words)]
+                      for mask in flag_masks]
+
+        self._set_columns(
+            # Nutrient matrix of shape (4, n); each row is contiguous
+            nutrients=np.array(
+                [[getattr(food, nutrient) for food in foods] for nutrient in self.NUTRIENTS],
+                dtype=np.float64
+            ).reshape(len(self.NUTRIENTS), len(foods)),
+            category_codes=np.array([category_codes[food.category] for food in foods], dtype=np.int16),
+            categories=categories,
+            flag_masks=np.array(flag_masks, dtype=np.uint64).reshape(len(foods), words),
+            flag_bits=flag_bits,
+            names=StringColumn.from_strings([food.name for food in foods]),
+            # Lower-cased names share one blob so an allergen pattern scans every food in one pass
+            normalized_names=StringColumn.from_strings([food.name.lower() for food in foods]),
+            portions=StringColumn.from_strings([food.portion for food in foods])
+        )
+        self._foods = foods
+
+    def _set_columns(self, nutrients: np.ndarray, category_codes: np.ndarray, categories: List[str],
+                     flag_masks: np.ndarray, flag_bits: Dict[str, int], names: StringColumn,
+                     normalized_names: StringColumn, portions: StringColumn, version: str = None):
+        self.nutrients = nutrients
+        self.calories, self.protein, self.carbs, self.fats = self.nutrients
+        self.category_codes = category_codes
+        self.categories = categories
+        # (foods, words); caches written before masks were widened hold one word per food
+        self.flag_masks = flag_masks.reshape(len(flag_masks), -1)
+        self.flag_bits = flag_bits
+        self.names = names
+        self.normalized_names = normalized_names
+        self.portions = portions
+        self.cache_path = None
+        self._version = version
+        self._portion_grams = None
+        self._substitute_trees = None
+        self._search_index = None
+        self._foods = None
+        self._positions = None
+        self._restriction_cache = LRUCache()
+        self._allergen_cache = LRUCache()
+        self._pool_cache = LRUCache()
+
+    def save_cache(self, path: str, source_stamp: Dict = None):
+        """Write the table to a versioned binary columnar cache file."""
+        columns = {name: getattr(self, name) for name in self.CACHE_COLUMNS}
+        for name in self.STRING_COLUMNS:
+            column = getattr(self, name)
+            columns[name + "_blob"], columns[name + "_offsets"] = column.blob, column.offsets
+        meta = {"version": self.version, "categories": self.categories,
+                "flag_bits": self.flag_bits, "source": source_stamp}
+        write_columns(path, meta, columns)
+
+    @classmethod
+    def load_cache(cls, path: str) -> Tuple["FoodTable", Dict]:
+        """Memory-map a cache file written by ``save_cache``.
+
+        Returns the table and the source stamp it was saved with. Raises
+        CacheFormatError for files of another cache format version and for
+        damaged ones.
+        """
+        meta, columns = read_columns(path)
+        table = cls.__new__(cls)
+        try:
+            strings = {
+                name: StringColumn(columns[name + "_blob"], columns[name + "_offsets"])
+                for name in cls.STRING_COLUMNS
+            }
+            table._set_columns(
+                categories=meta["categories"], flag_bits=meta["flag_bits"], version=meta["version"],
+                **{name: columns[name] for name in cls.CACHE_COLUMNS}, **strings
+            )
+            source = meta["source"]
+        except (KeyError, TypeError, ValueError) as e:
+            raise CacheFormatError(f"{path} is damaged: {e!r}")
+        table.cache_path = path
+        return table, source
+
+    def __reduce__(self):
+        # Cached tables are re-mapped by other processes instead of copied
+        if self.cache_path is not None:
+            return _load_cached_table, (self.cache_path,)
+        return super().__reduce__()
+
+    @property
+    def foods(self) -> List[FoodItem]:
+        """FoodItem objects for every row, built on first use for cached tables."""
+        if self._foods is None:
+            flags = sorted(self.flag_bits, key=self.flag_bits.get)
+            masks = [sum(word << (64 * i) for i, word in enumerate(row))
+                     for row in self.flag_masks.tolist()]
+            self._foods = [
+                FoodItem(self.names[i], *self.nutrients[:, i].tolist(),
+                         self.categories[self.category_codes[i]], self.portions[i],
+                         [flag for bit, flag in enumerate(flags) if mask >> bit & 1])
+                for i, mask in enumerate(masks)
+            ]
+        return self._foods
+
+    def __len__(self) -> int:
+        return len(self.category_codes)
+
+    def indices_of(self, meal) -> np.ndarray:
+        """Return a meal as an index array, converting FoodItem lists if needed."""
+        if isinstance(meal, np.ndarray):
+            return meal
+        if self._positions is None:
+            self._positions = {id(food): i for i, food in enumerate(self.foods)}
+        try:
+            return np.array([self._positions[id(food)] for food in meal], dtype=np.intp)
+        except KeyError:
+            raise ValueError("Meal contains a food item that is not in the food table")
+
+    def restriction_indices(self, restrictions: List[str]) -> np.ndarray:
+        """Return indices of foods carrying every restriction flag.
+
+        Results are cached per restriction combination and returned read-only.
+        """
+        key = frozenset(restriction.lower() for restriction in restrictions)
+        indices = self._restriction_cache.get(key)
+        if indices is None:
+            if all(flag in self.flag_bits for flag in key):
+                required = np.zeros(self.flag_masks.shape[1], dtype=np.uint64)
+                for flag in key:
+                    word, bit = divmod(self.flag_bits[flag], 64)
+                    required[word] |= np.uint64(1 << bit)
+                indices = np.flatnonzero(((self.flag_masks & required) == required).all(axis=1))
+            else:
+                # No food carries an unknown flag
+                indices = np.empty(0, dtype=np.intp)
+            indices.flags.writeable = False
+            self._restriction_cache.put(key, indices)
+        return indices
+
+    def allergen_free_indices(self, allergies: List[str]) -> np.ndarray:
+        """Return indices of foods whose names contain none of the allergens.
+
+        Every name is scanned once by a cached compiled pattern and matches
+        are mapped back to rows; results are cached per allergy list and
+        returned read-only.
+        """
+        key = normalize_allergens(allergies)
+        indices = self._allergen_cache.get(key)
+        if indices is None:
+            if key:
+                pattern = compile_allergens(key)
+                names = self.normalized_names
+                hits = np.fromiter(
+                    (match.start() for match in pattern.finditer(names.blob)), dtype=np.intp
+                )
+                allowed = np.ones(len(self), dtype=bool)
+                allowed[np.searchsorted(names.offsets, hits, side="right") - 1] = False
+                indices = np.flatnonzero(allowed)
+            else:
+                indices = np.arange(len(self), dtype=np.intp)
+            indices.flags.writeable = False
+            self._allergen_cache.put(key, indices)
+        return indices
+
+    def eligible_indices(self, restrictions: List[str], allergies: List[str]) -> np.ndarray:
+        """Return indices of foods allowed by both the restrictions and the allergies."""
+        return np.intersect1d(
+            self.restriction_indices(restrictions),
+            self.allergen_free_indices(allergies),
+            assume_unique=True
+        )
+
+    def candidate_pools(self, restrictions: List[str], allergies: List[str]) -> Dict[str, np.ndarray]:
+        """Return eligible food indices partitioned by category.
+
+        The partition is computed once per restriction/allergy combination and
+        cached, so meal generation only samples from it.
+        """
+        key = restriction_key(restrictions, allergies)
+        pools = self._pool_cache.get(key)
+        if pools is None:
+            eligible = self.eligible_indices(restrictions, allergies)
+            codes = self.category_codes[eligible]
+            order = np.argsort(codes, kind="stable")
+            bounds = np.searchsorted(codes[order], np.arange(len(self.categories) + 1))
+            pools = {}
+            for code, category in enumerate(self.categories):
+                pool = eligible[order[bounds[code]:bounds[code + 1]]]
+                pool.flags.writeable = False
+                pools[category] = pool
+            self._pool_cache.put(key, pools)
+        return pools
+
+    def cache_info(self) -> Dict[str, Dict[str, int]]:
+        """Return hit/miss counters of the filter caches."""
+        return {"restrictions": self._restriction_cache.info(),
+                "allergens": self._allergen_cache.info(),
+                "pools": self._pool_cache.info()}
+
+    def meal_totals(self, meals: List[np.ndarray], portions: List[np.ndarray] = None) -> np.ndarray:
+        """Return a (len(meals), 4) array of calories, protein, carbs and fats per meal.
+
+        ``portions`` optionally gives each item's portion multiple, aligned with ``meals``.
+        """
+        lengths = [len(meal) for meal in meals]
+        if not meals or not sum(lengths):
+            return np.zeros((len(meals), len(self.NUTRIENTS)))
+        indices = np.concatenate(meals).astype(np.intp, copy=False)
+        meal_ids = np.repeat(np.arange(len(meals)), lengths)
+        keys = (np.arange(len(self.NUTRIENTS))[:, None] * len(meals) + meal_ids).ravel()
+        weights = self.nutrients[:, indices]
+        if portions is not None:
+            weights = weights * np.concatenate(portions).astype(np.float64, copy=False)
+        totals = np.bincount(
+            keys, weights=weights.ravel(), minlength=len(self.NUTRIENTS) * len(meals)
+        )
+        return totals.reshape(len(self.NUTRIENTS), len(meals)).T
+
+    def summarize(self, meals: List[np.ndarray], portions: List[np.ndarray] = None) -> Dict:
+        """Build the per-meal and total nutrition summary of a plan given as index arrays.
+
+        With ``portions`` (portion multiples aligned with ``meals``) each food
+        also reports its servings and grams; grams are None for portions
+        without a gram weight.
+        """
+        meal_totals = self.meal_totals(meals, portions)
+        meal_details = []
+        for i, (meal, totals) in enumerate(zip(meals, meal_totals), 1):
+            foods = [{"name": self.names[j], "portion": self.portions[j]} for j in meal]
+            if portions is not None:
+                servings = np.asarray(portions[i - 1], dtype=np.float64)
+                grams = servings * self.portion_grams[meal]
+                for food, servings, amount in zip(foods, servings.tolist(), grams.tolist()):
+                    food["servings"] = round(servings, 2)
+                    food["grams"] = None if np.isnan(amount) else round(amount)
+            meal_details.append({
+                "meal_number": i,
+                "foods": foods,
+                "nutrition": self.rounded_nutrition(totals)
+            })
+        return {
+            "total_nutrition": self.rounded_nutrition(meal_totals.sum(axis=0)),
+            "meals": meal_details
+        }
+
+    @classmethod
+    def rounded_nutrition(cls, totals: np.ndarray) -> Dict[str, int]:
+        """Round a calories/protein/carbs/fats vector into a nutrition dict."""
+        return {
+            nutrient: round(float(value))
+            for nutrient, value in zip(cls.NUTRIENTS, totals)
+        }
+
+    @property
+    def version(self) -> str:
+        """Short hash of the table contents; changes whenever any food changes."""
+        if self._version is None:
+            digest = hashlib.sha1()
+            digest.update("\n".join(self.categories).encode())
+            digest.update(repr(sorted(self.flag_bits.items())).encode())
+            for column in (self.nutrients, self.category_codes, self.flag_masks,
+                           self.names.blob, self.portions.blob):
+                digest.update(np.ascontiguousarray(column).tobytes())
+            self._version = digest.hexdigest()[:12]
+        return self._version
+
+    @property
+    def portion_grams(self) -> np.ndarray:
+        """Grams in each food's portion, parsed from strings like "100g cooked"; NaN if none."""
+        if self._portion_grams is None:
+            grams = {}
+            for portion in set(self.portions):
+                match = re.search(r"(\d+(?:\.\d+)?)\s*g\b", portion)
+                grams[portion] = float(match.group(1)) if match else np.nan
+            self._portion_grams = np.array([grams[portion] for portion in self.portions])
+        return self._portion_grams
+
+    @property
+    def search_index(self) -> FoodSearchIndex:
+        """Name search index, built on first use."""
+        if self._search_index is None:
+            self._search_index = FoodSearchIndex(self.names)
+        return self._search_index
+
+    def similar_foods(self, food: int, k: int = 5, restrictions: List[str] = (),
+                      allergies: List[str] = ()) -> np.ndarray:
+        """Return up to k other foods of the same category with the closest macros.
+
+        Foods are compared by per-100g energy from calories, protein, carbs
+        and fats (all in kcal), using one k-d tree per category built on
+        first use. Only foods allowed by the restrictions and allergies
+        are returned, nearest first.
+        """
+        if self._substitute_trees is None:
+            grams = self.portion_grams
+            # Foods without a weight in their portion are taken as 100g
+            scale = np.where(np.isnan(grams) | (grams <= 0), 1.0, 100.0 / grams)
+            self._energy = self.nutrients.T * np.array([1.0, 4.0, 4.0, 9.0]) * scale[:, None]
+            self._substitute_trees = []
+            for code in range(len(self.categories)):
+                members = np.flatnonzero(self.category_codes == code)
+                self._substitute_trees.append(KDTree(self._energy[members], members))
+        code = self.category_codes[food]
+        pool = self.candidate_pools(restrictions, allergies)[self.categories[code]]
+        if not len(pool):
+            return np.empty(0, dtype=np.intp)
+
+        def allowed(ids: np.ndarray) -> np.ndarray:
+            positions = np.minimum(np.searchsorted(pool, ids), len(pool) - 1)
+            return (pool[positions] == ids) & (ids != food)
+
+        return self._substitute_trees[code].query(self._energy[food], k, allowed)
+
+def _load_cached_table(path: str) -> FoodTable:
+    return FoodTable.load_cache(path)[0]
+
+def read_food_source(path: str) -> List[FoodItem]:
+    """Parse a CSV or JSON food database into FoodItem objects.
+
+    JSON is a list of objects and CSV has a header row; both use the
+    FoodItem field names, with CSV dietary flags separated by ``;``.
+    Runs of whitespace in names, including newlines, become one space.
+    """
+    if path.endswith(".json"):
+        with open(path, 'r') as file:
+            rows = json.load(file)
+    else:
+        with open(path, 'r', newline='') as file:
+            rows = list(csv.DictReader(file))
+    foods = []
+    for number, row in enumerate(rows, 1):
+        try:
+            flags = row.get("dietary_flags") or []
+            if isinstance(flags, str):
+                flags = [flag.strip() for flag in flags.split(";") if flag.strip()]
+            foods.append(FoodItem(
+                " ".join(row["name"].split()), float(row["calories"]), float(row["protein"]),
+                float(row["carbs"]), float(row["fats"]), row["category"], row["portion"], flags
+            ))
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValueError(f"{path}: invalid food record {number}: {e!r}")
+    return foods
+
+def load_food_table(source: str, cache_path: str = None) -> FoodTable:
+    """Load a food database file through its binary columnar cache.
+
+    The source is parsed only when the cache (``<source>.cache`` by default)
+    is missing, of another format version, or was built from a different
+    source size or modification time. Otherwise the cache is memory-mapped,
+    so loading does not depend on the number of foods and processes mapping
+    the same cache share its pages.
+    """
+    cache_path = cache_path or source + ".cache"
+    stat = os.stat(source)
+    stamp = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    try:
+        table, cached_stamp = FoodTable.load_cache(cache_path)
+        if cached_stamp == stamp:
+            return table
+    except (FileNotFoundError, CacheFormatError):
+        pass
+    FoodTable(read_food_source(source)).save_cache(cache_path, stamp)
+    return FoodTable.load_cache(cache_path)[0]
+
+class KDTree:
+    """Static k-d tree for nearest-neighbour queries over a few dimensions.
+
+    Nodes are kept in flat lists; each leaf covers a contiguous slice of
+    the reordered ``points`` and ``ids``.
+    """
+
+    LEAF_SIZE = 16
+
+    def __init__(self, points: np.ndarray, ids: np.ndarray):
+        order = np.arange(len(points))
+        # Per node: split dimension (-1 for leaves), split value, children, slice
+        self.split_dims, self.split_values, self.children, self.bounds = [], [], [], []
+        stack = [(self._new_node(0, len(points)), 0, len(points))]
+        while stack:
+            node, start, end = stack.pop()
+            if end - start <= self.LEAF_SIZE:
+                continue
+            block = points[order[start:end]]
+            dim = int(np.argmax(block.max(axis=0) - block.min(axis=0)))
+            middle = (end - start) // 2
+            partition = np.argpartition(block[:, dim], middle)
+            order[start:end] = order[start:end][partition]
+            self.split_dims[node] = dim
+            self.split_values[node] = float(points[order[start + middle], dim])
+            left = self._new_node(start, start + middle)
+            right = self._new_node(start + middle, end)
+            self.children[node] = (left, right)
+            stack.append((left, start, start + middle))
+            stack.append((right, start + middle, end))
+        self.points = points[order]
+        self.ids = ids[order]
+
+    def _new_node(self, start: int, end: int) -> int:
+        self.split_dims.append(-1)
+        self.split_values.append(0.0)
+        self.children.append(None)
+        self.bounds.append((start, end))
+        return len(self.bounds) - 1
+
+    def query(self, point: np.ndarray, k: int,
+              accept: Callable[[np.ndarray], np.ndarray] = None) -> np.ndarray:
+        """Return the ids of the k nearest accepted points, nearest first.
+
+        ``accept`` maps an array of ids to a boolean mask of allowed ones.
+        Subtrees farther away than the current k-th best are skipped.
+        """
+        if k < 1:
+            return np.empty(0, dtype=np.intp)
+        best = []  # max-heap of (-distance, id)
+        frontier = [(0.0, 0)]
+        while frontier:
+            bound, node = heapq.heappop(frontier)
+            if len(best) == k and bound >= -best[0][0]:
+                break
+            dim = self.split_dims[node]
+            if dim < 0:
+                start, end = self.bounds[node]
+                ids = self.ids[start:end]
+                distances = ((self.points[start:end] - point) ** 2).sum(axis=1)
+                keep = accept(ids) if accept is not None else np.ones(len(ids), dtype=bool)
+                for distance, item in zip(distances[keep].tolist(), ids[keep].tolist()):
+                    if len(best) < k:
+                        heapq.heappush(best, (-distance, item))
+                    elif distance < -best[0][0]:
+                        heapq.heapreplace(best, (-distance, item))
+                continue
+            offset = float(point[dim]) - self.split_values[node]
+            near, far = self.children[node] if offset < 0 else self.children[node][::-1]
+            heapq.heappush(frontier, (bound, near))
+            heapq.heappush(frontier, (max(bound, offset * offset), far))
+        return np.array([item for _, item in sorted(best, reverse=True)], dtype=np.intp)
+
+class VarietyTracker:
+    """Per-item use counts over a rolling window of days.
+
+    Counts are updated as meals are picked and the oldest day is
+    subtracted when it leaves the window, so checking an item's recent
+    uses never rescans earlier days.
+    """
+
+    def __init__(self, size: int, max_uses: int, window: int = 7):
+        if max_uses < 1:
+            raise ValueError("max_uses must be at least 1")
+        self.max_uses = max_uses
+        self.window = window
+        self.counts = np.zeros(size, dtype=np.int32)
+        # Picks that had to exceed max_uses because too few items were under it
+        self.violations = 0
+        self._days = deque()
+        self._today = []
+
+    def pick(self, rng: np.random.Generator, pool: np.ndarray, count: int) -> np.ndarray:
+        """Draw up to ``count`` distinct items from pool that are under their limit.
+
+        When too few items are under the limit, the least used ones are
+        drawn instead and every pick over the limit is counted in ``violations``.
+        """
+        allowed = pool[self.counts[pool] < self.max_uses]
+        if len(allowed) >= count:
+            return rng.choice(allowed, count, replace=False)
+        least_used = pool[np.argsort(self.counts[pool], kind="stable")[:count]]
+        picked = rng.choice(least_used, min(count, len(least_used)), replace=False)
+        self.violations += int((self.counts[picked] >= self.max_uses).sum())
+        return picked
+
+    def use(self, items: np.ndarray):
+        """Record the items of one meal."""
+        np.add.at(self.counts, items, 1)
+        self._today.append(items)
+
+    def end_day(self):
+        """Close the current day and drop the day leaving the window."""
+        self._days.append(np.concatenate(self._today) if self._today else np.empty(0, dtype=np.intp))
+        self._today = []
+        if len(self._days) >= self.window:
+            np.subtract.at(self.counts, self._days.popleft(), 1)
+
+class PlanCancelled(Exception):
+    """Raised when meal plan generation is cancelled through its cancel event."""
+
+def _check_cancelled(cancel_event: threading.Event):
+    if cancel_event is not None and cancel_event.is_set():
+        raise PlanCancelled()
+
+def macro_deviation(totals: np.ndarray, target: np.ndarray) -> np.ndarray:
+    """Return the summed squared relative deviation of totals from a macro target.
+
+    ``totals`` may carry any leading batch dimensions; the last axis holds
+    calories, protein, carbs and fats.
+    """
+    scale = 1.0 / np.maximum(target, 1.0)
+    return (((totals - target) * scale) ** 2).sum(axis=-1)
+
+# Second-to-last slot options scored against the last slot per vectorized step
+SOLVER_LEAF_CHUNK = 256
+
+def solve_meal(slots: List[Tuple[np.ndarray, np.ndarray]], target: np.ndarray,
+               deadline: float, cancel_event: threading.Event = None) -> List[int]:
+    """Choose one option per slot so the summed macros best match a target.
+
+    Each slot is a ``(contributions, penalties)`` pair: an (options, 4)
+    array of the calories, protein, carbs and fats each option adds, and
+    the (options,) penalties added to the score of choosing it. A choice
+    scores ``macro_deviation`` of its totals plus its penalties. Returns
+    one option index per slot, the best found by branch and bound before
+    ``deadline`` (a ``time.perf_counter`` value) passes; setting
+    ``cancel_event`` raises PlanCancelled.
+    """
+    if not slots:
+        return []
+    scale = 1.0 / np.maximum(target, 1.0)
+
+    # Smallest and largest totals the slots after each depth can still add
+    zero = np.zeros_like(target, dtype=np.float64)
+    suffix_low, suffix_high = [zero], [zero]
+    for contributions, _ in reversed(slots):
+        suffix_low.insert(0, suffix_low[0] + contributions.min(axis=0))
+        suffix_high.insert(0, suffix_high[0] + contributions.max(axis=0))
+
+    best = {"score": np.inf, "choice": None, "timed_out": False}
+    choice = []
+    last_contributions, last_penalties = slots[-1]
+
+    def stop() -> bool:
+        if best["choice"] is not None and time.perf_counter() > deadline:
+            best["timed_out"] = True
+        if not best["timed_out"]:
+            _check_cancelled(cancel_event)
+        return best["timed_out"]
+
+    def search(depth: int, partial: np.ndarray, penalty: float):
+        contributions, penalties = slots[depth]
+        totals = partial + contributions
+        penalties = penalties + penalty
+        if depth == len(slots) - 1:
+            scores = macro_deviation(totals, target) + penalties
+            i = int(np.argmin(scores))
+            if scores[i] < best["score"]:
+                best["score"], best["choice"] = scores[i], choice + [i]
+            return
+        over = np.maximum(totals + suffix_low[depth + 1] - target, 0)
+        under = np.maximum(target - totals - suffix_high[depth + 1], 0)
+        bounds = (((over + under) * scale) ** 2).sum(axis=1) + penalties
+        order = np.argsort(bounds, kind="stable")
+        if depth < len(slots) - 2:
+            for i in order:
+                if bounds[i] >= best["score"] or stop():
+                    return
+                choice.append(int(i))
+                search(depth + 1, totals[i], penalties[i])
+                choice.pop()
+            return
+
+        # Pair the second-to-last slot with the last one a chunk of rows at a time
+        for start in range(0, len(order), SOLVER_LEAF_CHUNK):
+            rows = order[start:start + SOLVER_LEAF_CHUNK]
+            if bounds[rows[0]] >= best["score"] or stop():
+                return
+            scores = (macro_deviation(totals[rows, None, :] + last_contributions, target)
+                      + penalties[rows, None] + last_penalties)
+            row, last = divmod(int(np.argmin(scores)), scores.shape[1])
+            if scores[row, last] < best["score"]:
+                best["score"], best["choice"] = scores[row, last], choice + [int(rows[row]), last]
+
+    search(0, zero, 0.0)
+    return best["choice"]
+
+def fit_portions(per_portion: np.ndarray, target: np.ndarray, start: np.ndarray,
+                 low: np.ndarray, high: np.ndarray, regularization: float) -> np.ndarray:
+    """Fit (batch, items) portion multiples within ``[low, high]`` to (batch, 4) macro targets."""
+    # Primal active-set method on the box QP: deviation plus regularization * |x - start|**2;
+    # items with low == high stay fixed, which lets meals of different lengths share a batch
+    batch, _, items = per_portion.shape
+    rows = np.arange(batch)
+    identity = np.eye(items)
+    weighted = per_portion / np.maximum(target, 1.0)[:, :, None]
+    # Objective 0.5 * x.H.x + c.x
+    hessian = weighted.transpose(0, 2, 1) @ weighted + regularization * identity
+    linear = -(weighted.transpose(0, 2, 1) @ (target / np.maximum(target, 1.0))[:, :, None])[:, :, 0]
+    linear -= regularization * start
+
+    fixed = low >= high
+    at_low, at_high = fixed.copy(), np.zeros_like(fixed)
+    x = np.clip(start, low, high)
+    for _ in range(4 * items + 4):
+        # Minimize over the free items with the bound items held in place
+        free = ~(at_low | at_high)
+        system = np.where(free[:, :, None], hessian, identity)
+        rhs = np.where(free, -linear, x)
+        direction = np.linalg.solve(system, rhs[:, :, None])[:, :, 0] - x
+
+        # Step until the first free item reaches a bound
+        with np.errstate(divide='ignore', invalid='ignore'):
+            room = np.where(direction < 0, (low - x) / direction,
+                            np.where(direction > 0, (high - x) / direction, np.inf))
+        room = np.where(free, np.maximum(room, 0), np.inf)
+        blocking = np.argmin(room, axis=1)
+        step = np.minimum(room[rows, blocking], 1.0)
+        x += step[:, None] * direction
+        blocked = np.flatnonzero(step < 1.0)
+        lower = direction[blocked, blocking[blocked]] < 0
+        at_low[blocked[lower], blocking[blocked[lower]]] = True
+        at_high[blocked[~lower], blocking[blocked[~lower]]] = True
+        x = np.where(at_low, low, np.where(at_high, high, x))
+
+        # Release the bound item whose gradient pulls inwards the most
+        gradient = (hessian @ x[:, :, None])[:, :, 0] + linear
+        pull = np.where(at_low & ~fixed, -gradient, 0) + np.where(at_high & ~fixed, gradient, 0)
+        worst = np.argmax(pull, axis=1)
+        release = np.flatnonzero((step >= 1.0) & (pull[rows, worst] > 1e-9))
+        if not len(blocked) and not len(release):
+            break
+        at_low[release, worst[release]] = False
+        at_high[release, worst[release]] = False
+    return np.clip(x, low, high)
 
 class UserProfile:
+    MAX_MEALS_PER_DAY = 12
+    # Upper bounds of the body fields: kg, cm and years
+    FIELD_LIMITS = {"weight": 1000, "height": 300, "age": 150}
+
     def __init__(self):
         self.weight = 0
         self.height = 0
@@ -31,10 +815,111 @@ class UserProfile:
         self.meals_per_day = 3
         self.meal_history = []
 
+    @classmethod
+    def from_dict(cls, data: Dict) -> "UserProfile":
+        """Build a profile from a dict of its fields, e.g. one parsed from JSON."""
+        profile = cls()
+        for field, value in data.items():
+            if field == "meal_history" or not hasattr(profile, field):
+                raise ValueError(f"Unknown profile field: {field}")
+            setattr(profile, field, value)
+        profile.validate()
+        return profile
+
+    def validate(self):
+        """Raise ValueError if a field has the wrong type or an impossible value."""
+        for field, limit in self.FIELD_LIMITS.items():
+            value = getattr(self, field)
+            if (isinstance(value, bool) or not isinstance(value, (int, float))
+                    or not np.isfinite(value) or not 0 <= value <= limit):
+                raise ValueError(f"{field} must be a number from 0 to {limit}")
+        meals = self.meals_per_day
+        if isinstance(meals, bool) or not isinstance(meals, int) or not 1 <= meals <= self.MAX_MEALS_PER_DAY:
+            raise ValueError(f"meals_per_day must be an integer from 1 to {self.MAX_MEALS_PER_DAY}")
+        for field in ("gender", "activity_level", "goal"):
+            if not isinstance(getattr(self, field), str):
+                raise ValueError(f"{field} must be a string")
+        for field in ("dietary_restrictions", "allergies"):
+            value = getattr(self, field)
+            if not isinstance(value, list) or not all(isinstance(item, str) for item in value):
+                raise ValueError(f"{field} must be a list of strings")
+
+    def fingerprint(self) -> str:
+        """Return a stable hash of the fields that affect meal planning."""
+        fields = (
+            float(self.weight), float(self.height), float(self.age), self.gender.lower(),
+            self.activity_level, self.goal, int(self.meals_per_day),
+            sorted(restriction.lower() for restriction in self.dietary_restrictions),
+            normalize_allergens(self.allergies)
+        )
+        return hashlib.sha1(repr(fields).encode()).hexdigest()
+
 class DietPlanner:
-    def __init__(self):
-        self.food_database = self._initialize_food_database()
+    # Per-meal category rules for the optimizer: (category, items, portion multiples)
+    MEAL_SLOTS = (
+        ("protein", 1, (1, 2, 3)),
+        ("carbs", 1, (1, 2, 3)),
+        ("vegetable", 2, (1, 2)),
+        ("fats", 1, (0, 1, 2)),
+    )
+    # Score added per item already used in an earlier meal of the same plan
+    REPEAT_PENALTY = 0.02
+    # Options kept per optimizer slot, closest to the slot's share of the meal target,
+    # out of at most MAX_SLOT_CANDIDATES randomly drawn foods of larger pools
+    MAX_SLOT_OPTIONS = 32
+    MAX_SLOT_CANDIDATES = 4096
+    # Plans drawn per vectorized batch in sample mode
+    SAMPLE_CHUNK = 2048
+    # Bounds on each item's portion multiple when portions are scaled
+    PORTION_SCALE_RANGE = (0.25, 3.0)
+    # Weight pulling scaled portions towards the ones the planner picked
+    PORTION_REGULARIZATION = 0.01
+
+    # Activity level multipliers
+    ACTIVITY_MULTIPLIERS = {
+        "sedentary": 1.2,
+        "light": 1.375,
+        "moderate": 1.55,
+        "very_active": 1.725,
+        "extra_active": 1.9
+    }
+
+    # Goal adjustments
+    GOAL_ADJUSTMENTS = {
+        "lose": -500,
+        "maintain": 0,
+        "gain": 500
+    }
+
+    # Protein, carbs and fats shares of daily calories
+    MACRO_RATIOS = {
+        "vegan": (0.25, 0.55, 0.20),
+        "lose": (0.40, 0.35, 0.25),
+        "gain": (0.30, 0.50, 0.20),
+        "maintain": (0.30, 0.40, 0.30)
+    }
+
+    # Integer codes used by calculate_daily_needs_batch
+    ACTIVITY_LEVELS = tuple(ACTIVITY_MULTIPLIERS)
+    GOALS = tuple(GOAL_ADJUSTMENTS)
+
+    def __init__(self, profile_cache_size: int = 256, history: HistoryBackend = None,
+                 food_source: str = None):
+        # An external CSV/JSON database is memory-mapped from its binary cache
+        if food_source is not None:
+            self.food_table = load_food_table(food_source)
+        else:
+            self.food_table = FoodTable(self._initialize_food_database())
         self.user_profile = UserProfile()
+        self.rng = np.random.default_rng()
+        # Daily needs and candidate pools keyed by profile fingerprint
+        self.profile_cache = LRUCache(profile_cache_size)
+        # Where generated plans are recorded; defaults to meal_history.csv plus
+        # daily/weekly rollups, written in batches off the calling thread.
+        # Nothing is read or written until the first plan is saved.
+        if history is None:
+            history = HistoryWriter(RollupHistory(CSVHistoryBackend(), NutritionRollups()))
+        self.history = history
         
     def _initialize_food_database(self) -> List[FoodItem]:
         """Initialize a comprehensive database of food items with accurate nutritional values."""
@@ -175,45 +1060,67 @@ class DietPlanner:
         ]
         return foods
 
-    def calculate_daily_needs(self) -> Dict[str, float]:
-        """Calculate daily caloric and macro needs based on user profile."""
+    @property
+    def food_database(self) -> List[FoodItem]:
+        return self.food_table.foods
+
+    def set_food_database(self, foods: List[FoodItem]):
+        """Replace the food database and drop everything derived from it."""
+        self.set_food_table(FoodTable(foods))
+
+    def set_food_table(self, food_table: FoodTable):
+        """Replace the food table, e.g. with one from load_food_table, and drop cached inputs."""
+        self.food_table = food_table
+        self.profile_cache.invalidate()
+
+    def invalidate_profile_cache(self, fingerprint: str = None):
+        """Forget cached planning inputs for one profile fingerprint, or for all."""
+        self.profile_cache.invalidate(fingerprint)
+
+    def cache_info(self) -> Dict[str, Dict[str, int]]:
+        """Return hit/miss counters for the profile cache and the food table caches."""
+        info = {"profiles": self.profile_cache.info()}
+        info.update(self.food_table.cache_info())
+        return info
+
+    def _plan_inputs(self, profile: UserProfile) -> Tuple[Dict[str, float], Dict[str, np.ndarray]]:
+        """Return a profile's daily needs and candidate pools, memoized by fingerprint."""
+        fingerprint = profile.fingerprint()
+        inputs = self.profile_cache.get(fingerprint)
+        if inputs is None:
+            pools = self.food_table.candidate_pools(profile.dietary_restrictions, profile.allergies)
+            inputs = (self.calculate_daily_needs(profile), pools)
+            self.profile_cache.put(fingerprint, inputs)
+        return inputs
+
+    def calculate_daily_needs(self, profile: UserProfile = None) -> Dict[str, float]:
+        """Calculate daily caloric and macro needs based on user profile.
+
+        Uses ``self.user_profile`` unless another profile is given.
+        """
+        if profile is None:
+            profile = self.user_profile
         # Basic BMR calculation using Harris-Benedict equation
-        if self.user_profile.gender.lower() == "male":
-            bmr = 88.362 + (13.397 * self.user_profile.weight) + \
-                  (4.799 * self.user_profile.height) - (5.677 * self.user_profile.age)
+        if profile.gender.lower() == "male":
+            bmr = 88.362 + (13.397 * profile.weight) + \
+                  (4.799 * profile.height) - (5.677 * profile.age)
         else:
-            bmr = 447.593 + (9.247 * self.user_profile.weight) + \
-                  (3.098 * self.user_profile.height) - (4.330 * self.user_profile.age)
-
-        # Activity level multipliers
-        activity_multipliers = {
-            "sedentary": 1.2,
-            "light": 1.375,
-            "moderate": 1.55,
-            "very_active": 1.725,
-            "extra_active": 1.9
-        }
+            bmr = 447.593 + (9.247 * profile.weight) + \
+                  (3.098 * profile.height) - (4.330 * profile.age)
 
-        tdee = bmr * activity_multipliers.get(self.user_profile.activity_level, 1.2)
-
-        # Goal adjustments
-        goal_adjustments = {
-            "lose": -500,
-            "maintain": 0,
-            "gain": 500
-        }
-        
-        daily_calories = tdee + goal_adjustments.get(self.user_profile.goal, 0)
+        tdee = bmr * self.ACTIVITY_MULTIPLIERS.get(profile.activity_level, 1.2)
+        daily_calories = tdee + self.GOAL_ADJUSTMENTS.get(profile.goal, 0)
 
         # Macro splits based on goal and dietary restrictions
-        if "vegan" in self.user_profile.dietary_restrictions:
-            protein_ratio, carbs_ratio, fats_ratio = 0.25, 0.55, 0.20
-        elif self.user_profile.goal == "lose":
-            protein_ratio, carbs_ratio, fats_ratio = 0.40, 0.35, 0.25
-        elif self.user_profile.goal == "gain":
-            protein_ratio, carbs_ratio, fats_ratio = 0.30, 0.50, 0.20
+        # Restrictions match case-insensitively, as in fingerprint() and food filtering
+        if any(restriction.lower() == "vegan" for restriction in profile.dietary_restrictions):
+            protein_ratio, carbs_ratio, fats_ratio = self.MACRO_RATIOS["vegan"]
+        elif profile.goal == "lose":
+            protein_ratio, carbs_ratio, fats_ratio = self.MACRO_RATIOS["lose"]
+        elif profile.goal == "gain":
+            protein_ratio, carbs_ratio, fats_ratio = self.MACRO_RATIOS["gain"]
         else:  # maintain
-            protein_ratio, carbs_ratio, fats_ratio = 0.30, 0.40, 0.30
+            protein_ratio, carbs_ratio, fats_ratio = self.MACRO_RATIOS["maintain"]
 
         return {
             "calories": round(daily_calories),
@@ -222,342 +1129,665 @@ class DietPlanner:
             "fats": round(daily_calories * fats_ratio / 9)
         }
 
+    @classmethod
+    def calculate_daily_needs_batch(cls, weight, height, age, gender_code, activity_code,
+                                    goal_code, vegan) -> Dict[str, np.ndarray]:
+        """Vectorized ``calculate_daily_needs`` over columns of profile fields.
+
+        ``gender_code`` is 1 for male and 0 otherwise. ``activity_code`` and
+        ``goal_code`` index ``ACTIVITY_LEVELS`` and ``GOALS``; any other code
+        is treated like an unrecognized level or goal by the scalar method.
+        Results are identical to the scalar method, as int64 arrays.
+        """
+        weight = np.asarray(weight, dtype=np.float64)
+        height = np.asarray(height, dtype=np.float64)
+        age = np.asarray(age, dtype=np.float64)
+        activity_code = np.asarray(activity_code, dtype=np.intp)
+        goal_code = np.asarray(goal_code, dtype=np.intp)
+
+        # Basic BMR calculation using Harris-Benedict equation
+        bmr = np.where(
+            np.asarray(gender_code) == 1,
+            88.362 + (13.397 * weight) + (4.799 * height) - (5.677 * age),
+            447.593 + (9.247 * weight) + (3.098 * height) - (4.330 * age)
+        )
+
+        # Unknown codes map to a trailing default entry
+        multipliers = np.array(list(cls.ACTIVITY_MULTIPLIERS.values()) + [1.2])
+        activity_code = np.where(
+            (activity_code >= 0) & (activity_code < len(cls.ACTIVITY_LEVELS)),
+            activity_code, len(cls.ACTIVITY_LEVELS)
+        )
+        goal_code = np.where(
+            (goal_code >= 0) & (goal_code < len(cls.GOALS)), goal_code, len(cls.GOALS)
+        )
+        adjustments = np.array(list(cls.GOAL_ADJUSTMENTS.values()) + [0], dtype=np.float64)
+        daily_calories = bmr * multipliers[activity_code] + adjustments[goal_code]
+
+        # Ratio rows follow GOALS, then the unknown-goal and vegan rows
+        ratios = np.array(
+            [cls.MACRO_RATIOS.get(goal, cls.MACRO_RATIOS["maintain"]) for goal in cls.GOALS]
+            + [cls.MACRO_RATIOS["maintain"], cls.MACRO_RATIOS["vegan"]]
+        )
+        ratio_rows = ratios[np.where(np.asarray(vegan, dtype=bool), len(cls.GOALS) + 1, goal_code)]
+
+        return {
+            "calories": np.round(daily_calories).astype(np.int64),
+            "protein": np.round(daily_calories * ratio_rows[..., 0] / 4).astype(np.int64),
+            "carbs": np.round(daily_calories * ratio_rows[..., 1] / 4).astype(np.int64),
+            "fats": np.round(daily_calories * ratio_rows[..., 2] / 9).astype(np.int64)
+        }
+
+    @classmethod
+    def profile_columns(cls, profiles: Sequence[UserProfile]) -> Dict[str, np.ndarray]:
+        """Encode profiles as the columns taken by ``calculate_daily_needs_batch``."""
+        activity_codes = {level: code for code, level in enumerate(cls.ACTIVITY_LEVELS)}
+        goal_codes = {goal: code for code, goal in enumerate(cls.GOALS)}
+        return {
+            "weight": np.array([profile.weight for profile in profiles], dtype=np.float64),
+            "height": np.array([profile.height for profile in profiles], dtype=np.float64),
+            "age": np.array([profile.age for profile in profiles], dtype=np.float64),
+            "gender_code": np.array([int(profile.gender.lower() == "male") for profile in profiles],
+                                    dtype=np.int8),
+            "activity_code": np.array([activity_codes.get(profile.activity_level, -1)
+                                       for profile in profiles], dtype=np.intp),
+            "goal_code": np.array([goal_codes.get(profile.goal, -1) for profile in profiles],
+                                  dtype=np.intp),
+            "vegan": np.array([any(restriction.lower() == "vegan"
+                                   for restriction in profile.dietary_restrictions)
+                               for profile in profiles], dtype=bool)
+        }
+
+    def suggest_substitutes(self, food, k: int = 5, profile: UserProfile = None) -> np.ndarray:
+        """Suggest up to k foods similar to ``food`` (a FoodItem or table index).
+
+        Substitutes come from the same category, are ranked by per-100g
+        macro similarity and respect the profile's restrictions and
+        allergies (the current user profile by default). They are returned
+        as indices into ``self.food_table``, like meals.
+        """
+        profile = profile or self.user_profile
+        if isinstance(food, FoodItem):
+            food = self.food_table.indices_of([food])[0]
+        return self.food_table.similar_foods(
+            int(food), k, profile.dietary_restrictions, profile.allergies
+        )
+
+    def search_foods(self, query: str, limit: int = 10) -> np.ndarray:
+        """Return indices of the foods whose names best match a typed query.
+
+        Matches word prefixes and tolerates small typos; see FoodSearchIndex.
+        """
+        return self.food_table.search_index.search(query, limit)
+
     def filter_foods_by_restrictions(self, foods: List[FoodItem]) -> List[FoodItem]:
         """Filter foods based on dietary restrictions and allergies."""
-        filtered_foods = foods.copy()
-        
-        for restriction in self.user_profile.dietary_restrictions:
-            filtered_foods = [
-                food for food in filtered_foods 
-                if restriction.lower() in [flag.lower() for flag in food.dietary_flags]
-            ]
-            
-        # Remove foods with allergens
-        for allergen in self.user_profile.allergies:
-            filtered_foods = [
-                food for food in filtered_foods 
-                if allergen.lower() not in food.name.lower()
-            ]
-            
-        return filtered_foods
+        table = self.food_table if foods is self.food_database else FoodTable(foods)
+        indices = table.eligible_indices(
+            self.user_profile.dietary_restrictions, self.user_profile.allergies
+        )
+        return [foods[i] for i in indices]
 
-    def generate_meal_plan(self) -> List[List[FoodItem]]:
-        """Generate a meal plan that meets the daily nutritional needs."""
-        daily_needs = self.calculate_daily_needs()
-        meal_plan = []
-        calories_per_meal = daily_needs["calories"] / self.user_profile.meals_per_day
-        
-        for meal in range(self.user_profile.meals_per_day):
-            meal_items = []
-            current_calories = 0
-            
-            # Filter foods based on restrictions
-            available_foods = self.filter_foods_by_restrictions(self.food_database)
-            
-            # Ensure each meal has a protein source
-            protein_foods = [food for food in available_foods if food.category == "protein"]
-            if protein_foods:
-                protein_item = random.choice(protein_foods)
-                meal_items.append(protein_item)
-                current_calories += protein_item.calories
-            
-            # Add carbs
-            carb_foods = [food for food in available_foods if food.category == "carbs"]
-            if carb_foods:
-                carb_item = random.choice(carb_foods)
-                meal_items.append(carb_item)
-                current_calories += carb_item.calories
-            
-            # Add vegetables (at least 2)
-            vegetable_foods = [food for food in available_foods if food.category == "vegetable"]
-            for _ in range(2):
-                if vegetable_foods:
-                    vegetable_item = random.choice(vegetable_foods)
-                    meal_items.append(vegetable_item)
-                    current_calories += vegetable_item.calories
-            
-            # Add healthy fats if needed
-            if current_calories < calories_per_meal * 0.8:
-                fat_foods = [food for food in available_foods if food.category == "fats"]
-                if fat_foods:
-                    fat_item = random.choice(fat_foods)
-                    meal_items.append(fat_item)
-            
-            meal_plan.append(meal_items)
-        
-        # Save meal plan to history
+    def generate_meal_plan(self, mode: str = "random", time_budget: float = 0.05,
+                           samples: int = 10000, cancel_event: threading.Event = None,
+                           progress: Callable[[float], None] = None) -> List[np.ndarray]:
+        """Generate a meal plan that meets the daily nutritional needs.
+
+        ``mode="random"`` samples one item per category slot. ``mode="sample"``
+        draws ``samples`` random plans at once and keeps the one closest to
+        the daily macro targets. ``mode="optimize"`` searches foods and
+        integer portion multiples that best match the targets, returning the
+        best plan found within ``time_budget`` seconds. Each meal is returned
+        as an index array into ``self.food_table`` rather than a list of
+        FoodItem objects; ``self.food_table.foods`` or
+        ``get_meal_plan_summary`` turn it into items. Portion multiples
+        repeat the index.
+
+        ``progress`` is called with the completed fraction as work proceeds.
+        Setting ``cancel_event`` stops generation with PlanCancelled; nothing
+        is saved to history in that case. Both may be used from a worker thread.
+        """
+        meal_plan, _ = self._user_plan(mode, time_budget, samples, cancel_event, progress)
         self.save_meal_plan_to_history(meal_plan)
         return meal_plan
 
-    def save_meal_plan_to_history(self, meal_plan: List[List[FoodItem]]):
-        """Save the generated meal plan to user's history."""
-        summary = self.get_meal_plan_summary(meal_plan)
-        history_entry = {
-            "date": datetime.now().strftime("%Y-%m-%d"),
-            "summary": summary
-        }
-        self.user_profile.meal_history.append(history_entry)
-        
-        # Save to CSV file
-        with open('meal_history.csv', 'a', newline='') as file:
-            writer = csv.writer(file)
-            writer.writerow([
-                history_entry["date"],
-                json.dumps(summary)
-            ])
+    def generate_scaled_meal_plan(self, mode: str = "random", time_budget: float = 0.05,
+                                  samples: int = 10000, cancel_event: threading.Event = None,
+                                  progress: Callable[[float], None] = None
+                                  ) -> Tuple[List[np.ndarray], List[np.ndarray]]:
+        """Like ``generate_meal_plan``, then fit its portions; returns ``(meal_plan, portions)``."""
+        meal_plan, daily_needs = self._user_plan(mode, time_budget, samples, cancel_event, progress)
+        (meal_plan,), (portions,) = self.scale_portions([meal_plan], [daily_needs])
+        self.save_meal_plans_to_history([meal_plan], [self.user_profile], portions=[portions])
+        return meal_plan, portions
 
-    def get_meal_plan_summary(self, meal_plan: List[List[FoodItem]]) -> Dict:
-        """Generate a detailed summary of the meal plan's nutritional content."""
-        total_calories = 0
-        total_protein = 0
-        total_carbs = 0
-        total_fats = 0
+    def _user_plan(self, mode: str, time_budget: float, samples: int,
+                   cancel_event: threading.Event, progress: Callable[[float], None]
+                   ) -> Tuple[List[np.ndarray], Dict[str, float]]:
+        """Build a plan for ``self.user_profile`` and return it with the profile's daily needs."""
+        self._check_mode(mode, samples)
         
-        meal_details = []
-        
-        for i, meal in enumerate(meal_plan, 1):
-            meal_calories = sum(food.calories for food in meal)
-            meal_protein = sum(food.protein for food in meal)
-            meal_carbs = sum(food.carbs for food in meal)
-            meal_fats = sum(food.fats for food in meal)
-            
-            total_calories += meal_calories
-            total_protein += meal_protein
-            total_carbs += meal_carbs
-            total_fats += meal_fats
-            
-            meal_details.append({
-                "meal_number": i,
-                "foods": [{"name": food.name, "portion": food.portion} for food in meal],
-                "nutrition": {
-                    "calories": round(meal_calories),
-                    "protein": round(meal_protein),
-                    "carbs": round(meal_carbs),
-                    "fats": round(meal_fats)
-                }
-            })
-        
-        return {
-            "total_nutrition": {
-                "calories": round(total_calories),
-                "protein": round(total_protein),
-                "carbs": round(total_carbs),
-                "fats": round(total_fats)
-            },
-            "meals": meal_details
-        }
+        # Filter and partition foods once for the whole plan
+        daily_needs, pools = self._plan_inputs(self.user_profile)
+        meal_plan = self._build_plan(
+            self.user_profile, daily_needs, pools, mode, time_budget, samples,
+            cancel_event, progress
+        )
+        _check_cancelled(cancel_event)
+        return meal_plan, daily_needs
 
-class DietPlannerGUI:
-    def __init__(self, root):
-        self.root = root
-        self.root.title("AI Diet Planner")
-        self.planner = DietPlanner()
-        
-        # Create main notebook for tabs
-        self.notebook = ttk.Notebook(root)
-        self.notebook.pack(fill='both', expand=True, padx=10, pady=5)
-        
-        # Create tabs
-        self.profile_tab = ttk.Frame(self.notebook)
-        self.meal_plan_tab = ttk.Frame(self.notebook)
-        self.history_tab = ttk.Frame(self.notebook)
-        
-        self.notebook.add(self.profile_tab, text='Profile')
-        self.notebook.add(self.meal_plan_tab, text='Meal Plan')
-        self.notebook.add(self.history_tab, text='History')
-        
-        self._setup_profile_tab()
-        self._setup_meal_plan_tab()
-        self._setup_history_tab()
-
-    def _setup_profile_tab(self):
-        # Personal Information Frame
-        info_frame = ttk.LabelFrame(self.profile_tab, text="Personal Information")
-        info_frame.pack(fill='x', padx=10, pady=5)
-        
-        # Weight
-        ttk.Label(info_frame, text="Weight (kg):").grid(row=0, column=0, padx=5, pady=5)
-        self.weight_var = tk.StringVar()
-        ttk.Entry(info_frame, textvariable=self.weight_var).grid(row=0, column=1, padx=5, pady=5)
-        
-        # Height
-        ttk.Label(info_frame, text="Height (cm):").grid(row=1, column=0, padx=5, pady=5)
-        self.height_var = tk.StringVar()
-        ttk.Entry(info_frame, textvariable=self.height_var).grid(row=1, column=1, padx=5, pady=5)
-        
-        # Age
-        ttk.Label(info_frame, text="Age:").grid(row=2, column=0, padx=5, pady=5)
-        self.age_var = tk.StringVar()
-        ttk.Entry(info_frame, textvariable=self.age_var).grid(row=2, column=1, padx=5, pady=5)
-        
-        # Gender
-        # Gender
-        ttk.Label(info_frame, text="Gender:").grid(row=3, column=0, padx=5, pady=5)
-        self.gender_var = tk.StringVar()
-        gender_combo = ttk.Combobox(info_frame, textvariable=self.gender_var)
-        gender_combo['values'] = ('Male', 'Female')
-        gender_combo.grid(row=3, column=1, padx=5, pady=5)
-        
-        # Activity Level
-        ttk.Label(info_frame, text="Activity Level:").grid(row=4, column=0, padx=5, pady=5)
-        self.activity_var = tk.StringVar()
-        activity_combo = ttk.Combobox(info_frame, textvariable=self.activity_var)
-        activity_combo['values'] = ('Sedentary', 'Light', 'Moderate', 'Very Active', 'Extra Active')
-        activity_combo.grid(row=4, column=1, padx=5, pady=5)
+    def generate_meal_plans(self, profiles: Sequence[UserProfile], mode: str = "random",
+                            time_budget: float = 0.05, samples: int = 10000) -> List[List[np.ndarray]]:
+        """Generate one meal plan per profile in a single call.
+
+        Profiles with identical restriction and allergy sets share one
+        filtered candidate pool, and all plans are written to history in one
+        bulk append. ``mode``, ``time_budget`` and ``samples`` apply to every
+        profile as in ``generate_meal_plan``.
+        """
+        meal_plans, _ = self._profile_plans(profiles, mode, time_budget, samples)
+        self.save_meal_plans_to_history(meal_plans, profiles)
+        return meal_plans
+
+    def generate_scaled_meal_plans(self, profiles: Sequence[UserProfile], mode: str = "random",
+                                   time_budget: float = 0.05, samples: int = 10000
+                                   ) -> Tuple[List[List[np.ndarray]], List[List[np.ndarray]]]:
+        """Generate plans as ``generate_meal_plans`` does and fit all their portions in one batch."""
+        meal_plans, needs = self._profile_plans(profiles, mode, time_budget, samples)
+        meal_plans, portions = self.scale_portions(meal_plans, needs)
+        self.save_meal_plans_to_history(meal_plans, profiles, portions=portions)
+        return meal_plans, portions
+
+    def _profile_plans(self, profiles: Sequence[UserProfile], mode: str, time_budget: float,
+                       samples: int) -> Tuple[List[List[np.ndarray]], List[Dict[str, float]]]:
+        """Build one plan per profile and return the plans with each profile's daily needs."""
+        self._check_mode(mode, samples)
+        needs = self.calculate_daily_needs_batch(**self.profile_columns(profiles))
+        all_needs = [{nutrient: int(needs[nutrient][i]) for nutrient in needs}
+                     for i in range(len(profiles))]
+        groups = {}
+        for i, profile in enumerate(profiles):
+            key = restriction_key(profile.dietary_restrictions, profile.allergies)
+            groups.setdefault(key, []).append(i)
         
-        # Goal
-        ttk.Label(info_frame, text="Goal:").grid(row=5, column=0, padx=5, pady=5)
-        self.goal_var = tk.StringVar()
-        goal_combo = ttk.Combobox(info_frame, textvariable=self.goal_var)
-        goal_combo['values'] = ('Lose', 'Maintain', 'Gain')
-        goal_combo.grid(row=5, column=1, padx=5, pady=5)
+        meal_plans = [None] * len(profiles)
+        for indices in groups.values():
+            first = profiles[indices[0]]
+            pools = self.food_table.candidate_pools(first.dietary_restrictions, first.allergies)
+            for i in indices:
+                meal_plans[i] = self._build_plan(
+                    profiles[i], all_needs[i], pools, mode, time_budget, samples
+                )
+        return meal_plans, all_needs
+
+    def scale_portions(self, meal_plans: Sequence[List[np.ndarray]],
+                       daily_needs: Sequence[Dict[str, float]]
+                       ) -> Tuple[List[List[np.ndarray]], List[List[np.ndarray]]]:
+        """Fit each item's amount so every meal best matches its share of the daily needs.
+
+        A meal's target is its plan's daily needs divided by the plan's
+        number of meals. Repeated items in a meal are merged and start from
+        their repeat count; each item's portion multiple is then bounded by
+        ``PORTION_SCALE_RANGE``, except for portions without a gram weight,
+        which keep their count. All meals of all plans are solved as one
+        batch by ``fit_portions``.
+
+        Returns the merged meal plans and, per meal, each item's portion
+        multiple; ``FoodTable.portion_grams`` converts these to grams.
+        """
+        table = self.food_table
+        meals, starts, targets = [], [], []
+        for meal_plan, needs in zip(meal_plans, daily_needs):
+            target = np.array([needs[nutrient] for nutrient in FoodTable.NUTRIENTS],
+                              dtype=np.float64) / max(len(meal_plan), 1)
+            for meal in meal_plan:
+                items, first, counts = np.unique(table.indices_of(meal), return_index=True,
+                                                 return_counts=True)
+                order = np.argsort(first)
+                meals.append(items[order])
+                starts.append(counts[order])
+                targets.append(target)
+        if not meals:
+            return [list(meal_plan) for meal_plan in meal_plans], [[] for _ in meal_plans]
+
+        # Pad meals to a common length with fixed zero-nutrient items
+        lengths = np.array([len(meal) for meal in meals])
+        present = np.arange(max(lengths.max(), 1)) < lengths[:, None]
+        items = np.zeros(present.shape, dtype=np.intp)
+        items[present] = np.concatenate(meals)
+        start = np.zeros(present.shape)
+        start[present] = np.concatenate(starts)
+        per_portion = table.nutrients[:, items].transpose(1, 0, 2) * present[:, None, :]
+        scalable = present & ~np.isnan(table.portion_grams[items])
+        low, high = self.PORTION_SCALE_RANGE
+        portions = fit_portions(
+            per_portion, np.array(targets), start, np.where(scalable, low, start),
+            np.where(scalable, high, start), self.PORTION_REGULARIZATION
+        )
+
+        meal_portions = np.split(portions[present], np.cumsum(lengths)[:-1])
+        scaled_plans, plan_portions, position = [], [], 0
+        for meal_plan in meal_plans:
+            scaled_plans.append(meals[position:position + len(meal_plan)])
+            plan_portions.append(meal_portions[position:position + len(meal_plan)])
+            position += len(meal_plan)
+        return scaled_plans, plan_portions
+
+    def generate_period_plan(self, days: int = 7, workers: int = None, mode: str = "random",
+                             time_budget: float = 0.05, samples: int = 10000, seed: int = None,
+                             start_date: str = None, max_weekly_uses: int = None) -> List[List[np.ndarray]]:
+        """Generate one meal plan per day for ``days`` consecutive days.
+
+        Days are spread over ``workers`` processes (in-process when ``workers``
+        is None or 1). Each day draws from its own generator, seeded with a
+        per-day seed derived from ``seed`` and recorded in history, so
+        random and sample mode results do not depend on the number of
+        workers. Workers receive the food table once when they
+        start, not with every task. All days are written to history in one
+        append, dated from ``start_date`` (default today) onwards.
+
+        With ``max_weekly_uses`` set, random mode plans never repeat an item
+        within a meal and use each item at most that many times in any 7
+        consecutive days, as far as the candidate pools allow; a
+        RuntimeWarning reports picks that had to exceed the limit. Each day
+        then depends on the ones before it, so the days are planned
+        in-process and ``workers`` is ignored.
+        """
+        self._check_mode(mode, samples)
+        if days < 1:
+            raise ValueError("days must be at least 1")
+        if max_weekly_uses is not None and mode != "random":
+            raise ValueError("max_weekly_uses is only supported in random mode")
+        profile = self.user_profile
+        daily_needs, pools = self._plan_inputs(profile)
+        if seed is None:
+            seed = int(self.rng.integers(2**63))
+        day_seeds = [int(day_seed) for day_seed in
+                     np.random.SeedSequence(seed).generate_state(days, dtype=np.uint64)]
+        args = (profile, daily_needs, pools, mode, time_budget, samples)
+
+        if max_weekly_uses is not None:
+            tracker = VarietyTracker(len(self.food_table), max_weekly_uses)
+            meal_plans = self._varied_days(profile, daily_needs, pools, day_seeds, tracker)
+            if tracker.violations:
+                warnings.warn(f"{tracker.violations} picks exceed max_weekly_uses={max_weekly_uses}; "
+                              "the candidate pools are too small for that limit",
+                              RuntimeWarning, stacklevel=2)
+        elif workers is None or workers <= 1:
+            meal_plans = self._plan_days(*args, day_seeds)
+        else:
+            workers = min(workers, days)
+            chunks = [day_seeds[i::workers] for i in range(workers)]
+            # Imported here to keep multiprocessing off the CLI's start-up path
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+            # Spawned, not forked: the parent may be running the history writer thread
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_period_worker,
+                                     initargs=(self.food_table,),
+                                     mp_context=multiprocessing.get_context("spawn")) as executor:
+                futures = [executor.submit(_plan_period_days, *args, chunk) for chunk in chunks]
+                results = [future.result() for future in futures]
+            # Undo the round-robin split so plans are in day order
+            meal_plans = [None] * days
+            for i, chunk_plans in enumerate(results):
+                meal_plans[i::workers] = chunk_plans
+
+        first_day = datetime.strptime(start_date, "%Y-%m-%d") if start_date else datetime.now()
+        dates = [(first_day + timedelta(days=i)).strftime("%Y-%m-%d") for i in range(days)]
+        self.save_meal_plans_to_history(meal_plans, [profile] * days, dates, day_seeds)
+        return meal_plans
+
+    def _plan_days(self, profile: UserProfile, daily_needs: Dict[str, float],
+                   pools: Dict[str, np.ndarray], mode: str, time_budget: float, samples: int,
+                   day_seeds: Sequence[int]) -> List[List[np.ndarray]]:
+        """Build one plan per seed, each with a generator seeded from it."""
+        rng = self.rng
+        try:
+            meal_plans = []
+            for day_seed in day_seeds:
+                self.rng = np.random.default_rng(day_seed)
+                meal_plans.append(self._build_plan(profile, daily_needs, pools, mode,
+                                                   time_budget, samples))
+            return meal_plans
+        finally:
+            self.rng = rng
+
+    def _varied_days(self, profile: UserProfile, daily_needs: Dict[str, float],
+                     pools: Dict[str, np.ndarray], day_seeds: Sequence[int],
+                     tracker: VarietyTracker) -> List[List[np.ndarray]]:
+        """Build consecutive random plans whose items respect the tracker's limits."""
+        calories_per_meal = daily_needs["calories"] / profile.meals_per_day
+        meal_plans = []
+        for day_seed in day_seeds:
+            rng = np.random.default_rng(day_seed)
+            meal_plans.append([
+                self._varied_meal(rng, pools, calories_per_meal, tracker)
+                for _ in range(profile.meals_per_day)
+            ])
+            tracker.end_day()
+        return meal_plans
+
+    def _varied_meal(self, rng: np.random.Generator, pools: Dict[str, np.ndarray],
+                     calories_per_meal: float, tracker: VarietyTracker) -> np.ndarray:
+        """Sample one meal with the ``_random_meal`` slots, without repeats."""
+        empty = np.empty(0, dtype=np.intp)
+        meal_items = []
+        for category, count in (("protein", 1), ("carbs", 1), ("vegetable", 2)):
+            meal_items.extend(tracker.pick(rng, pools.get(category, empty), count))
+        if self.food_table.calories[meal_items].sum() < calories_per_meal * 0.8:
+            meal_items.extend(tracker.pick(rng, pools.get("fats", empty), 1))
+        meal = np.array(meal_items, dtype=np.intp)
+        tracker.use(meal)
+        return meal
+
+    @staticmethod
+    def _check_mode(mode: str, samples: int):
+        if mode not in ("random", "sample", "optimize"):
+            raise ValueError(f"Unknown meal plan mode: {mode}")
+        if mode == "sample" and samples < 1:
+            raise ValueError("samples must be at least 1")
+
+    def _build_plan(self, profile: UserProfile, daily_needs: Dict[str, float],
+                    pools: Dict[str, np.ndarray], mode: str, time_budget: float,
+                    samples: int, cancel_event: threading.Event = None,
+                    progress: Callable[[float], None] = None) -> List[np.ndarray]:
+        """Generate one plan for a profile from already filtered candidate pools."""
+        meals_per_day = profile.meals_per_day
+        if mode == "optimize":
+            return self._optimized_plan(pools, daily_needs, meals_per_day, time_budget,
+                                        cancel_event, progress)
+        if mode == "sample":
+            return self._sampled_plan(pools, daily_needs, meals_per_day, samples,
+                                      cancel_event, progress)
+        calories_per_meal = daily_needs["calories"] / meals_per_day
+        meal_plan = [self._random_meal(pools, calories_per_meal) for _ in range(meals_per_day)]
+        if progress is not None:
+            progress(1.0)
+        return meal_plan
+
+    def _random_meal(self, pools: Dict[str, np.ndarray], calories_per_meal: float) -> np.ndarray:
+        """Sample one meal from per-category candidate pools."""
+        empty = np.empty(0, dtype=np.intp)
+        meal_items = []
         
-        # Meals per day
-        ttk.Label(info_frame, text="Meals per day:").grid(row=6, column=0, padx=5, pady=5)
-        self.meals_var = tk.StringVar(value="3")
-        meals_spin = ttk.Spinbox(info_frame, from_=2, to=6, textvariable=self.meals_var)
-        meals_spin.grid(row=6, column=1, padx=5, pady=5)
+        # Ensure each meal has a protein source
+        protein_foods = pools.get("protein", empty)
+        if len(protein_foods):
+            meal_items.append(self.rng.choice(protein_foods))
         
-        # Dietary Restrictions Frame
-        restrictions_frame = ttk.LabelFrame(self.profile_tab, text="Dietary Restrictions")
-        restrictions_frame.pack(fill='x', padx=10, pady=5)
+        # Add carbs
+        carb_foods = pools.get("carbs", empty)
+        if len(carb_foods):
+            meal_items.append(self.rng.choice(carb_foods))
         
-        # Dietary Restrictions
-        self.vegan_var = tk.BooleanVar()
-        ttk.Checkbutton(restrictions_frame, text="Vegan", variable=self.vegan_var).grid(row=0, column=0, padx=5, pady=5)
+        # Add vegetables (at least 2)
+        vegetable_foods = pools.get("vegetable", empty)
+        if len(vegetable_foods):
+            meal_items.extend(self.rng.choice(vegetable_foods, 2))
         
-        self.vegetarian_var = tk.BooleanVar()
-        ttk.Checkbutton(restrictions_frame, text="Vegetarian", variable=self.vegetarian_var).grid(row=0, column=1, padx=5, pady=5)
+        # Add healthy fats if needed
+        current_calories = self.food_table.calories[meal_items].sum()
+        if current_calories < calories_per_meal * 0.8:
+            fat_foods = pools.get("fats", empty)
+            if len(fat_foods):
+                meal_items.append(self.rng.choice(fat_foods))
         
-        self.gluten_free_var = tk.BooleanVar()
-        ttk.Checkbutton(restrictions_frame, text="Gluten-Free", variable=self.gluten_free_var).grid(row=0, column=2, padx=5, pady=5)
+        return np.array(meal_items, dtype=np.intp)
+
+    def _sampled_plan(self, pools: Dict[str, np.ndarray], daily_needs: Dict[str, float],
+                      meals_per_day: int, samples: int, cancel_event: threading.Event = None,
+                      progress: Callable[[float], None] = None) -> List[np.ndarray]:
+        """Draw many random plans as index matrices and keep the best scoring one.
+
+        Uses the same slot rules as ``_random_meal``. Missing slots point at
+        a zero-nutrient sentinel row so every plan has the same shape. Plans
+        are drawn in chunks of ``SAMPLE_CHUNK`` to bound memory and to allow
+        progress reports and cancellation between chunks.
+        """
+        calories_per_meal = daily_needs["calories"] / meals_per_day
+        target = np.array([daily_needs[nutrient] for nutrient in FoodTable.NUTRIENTS],
+                          dtype=np.float64)
+        sentinel = len(self.food_table)
+        nutrients = np.vstack([self.food_table.nutrients.T, np.zeros(len(FoodTable.NUTRIENTS))])
         
-        # Allergies Frame
-        allergies_frame = ttk.LabelFrame(self.profile_tab, text="Allergies")
-        allergies_frame.pack(fill='x', padx=10, pady=5)
+        def draw(category: str, shape: Tuple[int, ...]) -> np.ndarray:
+            pool = pools.get(category)
+            if pool is None or not len(pool):
+                return np.full(shape, sentinel, dtype=np.intp)
+            return pool[self.rng.integers(len(pool), size=shape)]
         
-        ttk.Label(allergies_frame, text="List allergies (comma-separated):").grid(row=0, column=0, padx=5, pady=5)
-        self.allergies_var = tk.StringVar()
-        ttk.Entry(allergies_frame, textvariable=self.allergies_var).grid(row=0, column=1, padx=5, pady=5)
+        best_score, best = np.inf, None
+        for start in range(0, samples, self.SAMPLE_CHUNK):
+            _check_cancelled(cancel_event)
+            count = min(self.SAMPLE_CHUNK, samples - start)
+            
+            # Protein, carbs and two vegetables, then fats for meals under 80% of target
+            picks = np.concatenate([
+                draw("protein", (count, meals_per_day, 1)),
+                draw("carbs", (count, meals_per_day, 1)),
+                draw("vegetable", (count, meals_per_day, 2)),
+                draw("fats", (count, meals_per_day, 1))
+            ], axis=2)
+            base_calories = nutrients[picks[..., :-1], 0].sum(axis=2)
+            picks[..., -1] = np.where(base_calories < calories_per_meal * 0.8, picks[..., -1], sentinel)
+            
+            scores = macro_deviation(nutrients[picks].sum(axis=(1, 2)), target)
+            i = int(np.argmin(scores))
+            if scores[i] < best_score:
+                best_score, best = scores[i], picks[i]
+            if progress is not None:
+                progress((start + count) / samples)
+        return [meal[meal != sentinel] for meal in best]
+
+    def _optimized_plan(self, pools: Dict[str, np.ndarray], daily_needs: Dict[str, float],
+                        meals_per_day: int, time_budget: float,
+                        cancel_event: threading.Event = None,
+                        progress: Callable[[float], None] = None) -> List[np.ndarray]:
+        """Solve each meal against an equal share of the daily targets."""
+        target = np.array([daily_needs[nutrient] for nutrient in FoodTable.NUTRIENTS],
+                          dtype=np.float64) / meals_per_day
+        start = time.perf_counter()
         
-        # Save Button
-        save_button = ttk.Button(self.profile_tab, text="Save Profile", command=self.save_profile)
-        save_button.pack(pady=10)
-
-    def _setup_meal_plan_tab(self):
-        # Generate Plan Button
-        generate_button = ttk.Button(self.meal_plan_tab, text="Generate Meal Plan", command=self.generate_meal_plan)
-        generate_button.pack(pady=10)
+        # Draw at most MAX_SLOT_CANDIDATES foods per slot so setup time does
+        # not grow with the database
+        nutrients = self.food_table.nutrients.T
+        empty = np.empty(0, dtype=np.intp)
+        slot_pools = []
+        for category, _, _ in self.MEAL_SLOTS:
+            pool = pools.get(category, empty)
+            if len(pool) > self.MAX_SLOT_CANDIDATES:
+                pool = np.sort(self.rng.choice(pool, self.MAX_SLOT_CANDIDATES, replace=False))
+            slot_pools.append(pool)
         
-        # Meal Plan Display
-        self.meal_plan_text = tk.Text(self.meal_plan_tab, height=20, width=50)
-        self.meal_plan_text.pack(padx=10, pady=5, fill='both', expand=True)
+        # Each slot's expected share of every nutrient, from its pool's average food
+        typical = np.array([
+            count * nutrients[pool].mean(axis=0) if len(pool) else np.zeros(len(FoodTable.NUTRIENTS))
+            for (_, count, _), pool in zip(self.MEAL_SLOTS, slot_pools)
+        ])
+        shares = typical / np.maximum(typical.sum(axis=0), 1e-9) * target
         
-        # Export Button
-        export_button = ttk.Button(self.meal_plan_tab, text="Export Meal Plan", command=self.export_meal_plan)
-        export_button.pack(pady=10)
-
-    def _setup_history_tab(self):
-        # History Display
-        self.history_text = tk.Text(self.history_tab, height=20, width=50)
-        self.history_text.pack(padx=10, pady=5, fill='both', expand=True)
+        # Enumerate each slot's options once for the whole plan, keeping those
+        # closest to the slot's share so the search stays bounded too
+        slots = []
+        for (category, count, multiples), pool, share in zip(self.MEAL_SLOTS, slot_pools, shares):
+            if not len(pool):
+                continue
+            foods = np.repeat(pool, len(multiples))
+            portions = np.tile(np.array(multiples, dtype=np.intp), len(pool))
+            if 0 in multiples:
+                # Keep a single empty option for optional slots
+                keep = np.r_[True, portions[1:] > 0]
+                foods, portions = foods[keep], portions[keep]
+            if len(foods) > self.MAX_SLOT_OPTIONS:
+                deviation = macro_deviation(nutrients[foods] * portions[:, None], share / count)
+                keep = np.argpartition(deviation, self.MAX_SLOT_OPTIONS)[:self.MAX_SLOT_OPTIONS]
+                if 0 in multiples:
+                    keep = np.union1d(keep, [0])
+                keep.sort()
+                foods, portions = foods[keep], portions[keep]
+            parts = np.array(list(combinations_with_replacement(range(len(foods)), count)),
+                             dtype=np.intp)
+            contributions = (nutrients[foods] * portions[:, None])[parts].sum(axis=1)
+            slots.append((foods, portions, parts, contributions))
         
-        # Refresh Button
-        refresh_button = ttk.Button(self.history_tab, text="Refresh History", command=self.load_history)
-        refresh_button.pack(pady=10)
+        used = np.zeros(len(self.food_table), dtype=bool)
+        meal_plan = []
+        for meal in range(meals_per_day):
+            deadline = start + time_budget * (meal + 1) / meals_per_day
+            meal_slots = [
+                (contributions, self.REPEAT_PENALTY * (used[foods] & (portions > 0))[parts].sum(axis=1))
+                for foods, portions, parts, contributions in slots
+            ]
+            choice = solve_meal(meal_slots, target, deadline, cancel_event)
+            meal_items = np.concatenate([
+                np.repeat(foods[parts[option]], portions[parts[option]])
+                for (foods, portions, parts, _), option in zip(slots, choice)
+            ] or [np.empty(0, dtype=np.intp)])
+            used[meal_items] = True
+            meal_plan.append(meal_items)
+            if progress is not None:
+                progress((meal + 1) / meals_per_day)
+        return meal_plan
 
-    def save_profile(self):
-        try:
-            self.planner.user_profile.weight = float(self.weight_var.get())
-            self.planner.user_profile.height = float(self.height_var.get())
-            self.planner.user_profile.age = int(self.age_var.get())
-            self.planner.user_profile.gender = self.gender_var.get()
-            self.planner.user_profile.activity_level = self.activity_var.get().lower()
-            self.planner.user_profile.goal = self.goal_var.get().lower()
-            self.planner.user_profile.meals_per_day = int(self.meals_var.get())
-            
-            # Get dietary restrictions
-            restrictions = []
-            if self.vegan_var.get():
-                restrictions.append("vegan")
-            if self.vegetarian_var.get():
-                restrictions.append("vegetarian")
-            if self.gluten_free_var.get():
-                restrictions.append("gluten-free")
-            self.planner.user_profile.dietary_restrictions = restrictions
-            
-            # Get allergies
-            allergies = [a.strip() for a in self.allergies_var.get().split(',') if a.strip()]
-            self.planner.user_profile.allergies = allergies
-            
-            messagebox.showinfo("Success", "Profile saved successfully!")
-            
-        except ValueError as e:
-            messagebox.showerror("Error", "Please enter valid numeric values for weight, height, and age.")
+    def save_meal_plan_to_history(self, meal_plan: List[np.ndarray]):
+        """Save the generated meal plan to user's history."""
+        self.save_meal_plans_to_history([meal_plan], [self.user_profile])
 
-    def generate_meal_plan(self):
-        if not self.planner.user_profile.weight:
-            messagebox.showwarning("Warning", "Please save your profile first!")
-            return
-            
-        meal_plan = self.planner.generate_meal_plan()
-        summary = self.planner.get_meal_plan_summary(meal_plan)
-        
-        # Display meal plan
-        self.meal_plan_text.delete(1.0, tk.END)
-        self.meal_plan_text.insert(tk.END, "Your Meal Plan\n\n")
-        
-        # Display daily totals
-        totals = summary["total_nutrition"]
-        self.meal_plan_text.insert(tk.END, f"Daily Totals:\n")
-        self.meal_plan_text.insert(tk.END, f"Calories: {totals['calories']} kcal\n")
-        self.meal_plan_text.insert(tk.END, f"Protein: {totals['protein']}g\n")
-        self.meal_plan_text.insert(tk.END, f"Carbs: {totals['carbs']}g\n")
-        self.meal_plan_text.insert(tk.END, f"Fats: {totals['fats']}g\n\n")
+    def save_meal_plans_to_history(self, meal_plans: List[List[np.ndarray]],
+                                   profiles: Sequence[UserProfile], dates: Sequence[str] = None,
+                                   seeds: Sequence[int] = None,
+                                   portions: Sequence[List[np.ndarray]] = None):
+        """Save several meal plans to their profiles' histories in one bulk write.
+
+        Plans are dated today unless ``dates`` gives one date per plan.
+        Entries also carry the food IDs of each meal, the profile
+        fingerprint and, when given, the seed each plan was generated from,
+        which is all a compact history store keeps, and the scaled
+        ``portions`` of each meal when given.
+        """
+        if dates is None:
+            dates = [datetime.now().strftime("%Y-%m-%d")] * len(meal_plans)
+        if seeds is None:
+            seeds = [None] * len(meal_plans)
+        if portions is None:
+            portions = [None] * len(meal_plans)
+        entries = []
+        for meal_plan, profile, date, seed, plan_portions in zip(meal_plans, profiles, dates,
+                                                                 seeds, portions):
+            meals = [self.food_table.indices_of(meal) for meal in meal_plan]
+            history_entry = {
+                "date": date,
+                "summary": self.food_table.summarize(meals, plan_portions),
+                "food_ids": [meal.tolist() for meal in meals],
+                "portions": None if plan_portions is None else [meal.tolist() for meal in plan_portions],
+                "profile": profile.fingerprint(),
+                "seed": seed
+            }
+            profile.meal_history.append(history_entry)
+            entries.append(history_entry)
         
-        # Display meals
-        for meal in summary["meals"]:
-            self.meal_plan_text.insert(tk.END, f"\nMeal {meal['meal_number']}:\n")
-            for food in meal["foods"]:
-                self.meal_plan_text.insert(tk.END, f"- {food['name']} ({food['portion']})\n")
-            
-            nutrition = meal["nutrition"]
-            self.meal_plan_text.insert(tk.END, f"\nMeal Nutrition:\n")
-            self.meal_plan_text.insert(tk.END, f"Calories: {nutrition['calories']} kcal\n")
-            self.meal_plan_text.insert(tk.END, f"Protein: {nutrition['protein']}g\n")
-            self.meal_plan_text.insert(tk.END, f"Carbs: {nutrition['carbs']}g\n")
-            self.meal_plan_text.insert(tk.END, f"Fats: {nutrition['fats']}g\n")
-            self.meal_plan_text.insert(tk.END, "\n" + "-"*40 + "\n")
-
-    def export_meal_plan(self):
-        try:
-            content = self.meal_plan_text.get(1.0, tk.END)
-            with open('meal_plan.txt', 'w') as f:
-                f.write(content)
-            messagebox.showinfo("Success", "Meal plan exported to meal_plan.txt")
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to export meal plan: {str(e)}")
-
-    def load_history(self):
+        self.history.append(entries)
+
+    def get_meal_plan_summary(self, meal_plan: List[np.ndarray],
+                              portions: List[np.ndarray] = None) -> Dict:
+        """Generate a detailed summary of the meal plan's nutritional content.
+
+        Meals may be index arrays into ``self.food_table`` or lists of FoodItem.
+        Scaled ``portions`` from ``scale_portions`` add each food's servings
+        and grams and weight the nutrition totals.
+        """
+        table = self.food_table
+        return table.summarize([table.indices_of(meal) for meal in meal_plan], portions)
+
+# Planner used by generate_period_plan worker processes
+_period_planner = None
+
+def _init_period_worker(food_table: FoodTable):
+    global _period_planner
+    _period_planner = DietPlanner(history=NullHistoryBackend())
+    _period_planner.set_food_table(food_table)
+
+def _plan_period_days(*args) -> List[List[np.ndarray]]:
+    return _period_planner._plan_days(*args)
+
+def load_profiles(path: str) -> List[UserProfile]:
+    """Read profiles from a JSON object, a JSON list or JSON lines ('-' reads stdin)."""
+    if path == "-":
+        text = sys.stdin.read()
+    else:
+        with open(path, 'r') as file:
+            text = file.read()
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        data = [json.loads(line) for line in text.splitlines() if line.strip()]
+    if isinstance(data, dict):
+        data = [data]
+    return [UserProfile.from_dict(item) for item in data]
+
+def main(argv: List[str] = None):
+    """Launch the GUI, or generate plans headlessly when --profiles is given."""
+    parser = argparse.ArgumentParser(prog="python -m app", description="AI Diet Planner")
+    parser.add_argument("--profiles", help="JSON or JSONL file of user profiles, '-' for stdin; "
+                                           "without it the GUI is launched")
+    parser.add_argument("--output", help="write JSONL results to this file instead of stdout")
+    parser.add_argument("--mode", choices=("random", "sample", "optimize"), default="random")
+    parser.add_argument("--samples", type=int, default=10000)
+    parser.add_argument("--time-budget", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, help="seed the planner's random generator")
+    parser.add_argument("--foods", help="CSV or JSON food database to use instead of the built-in one")
+    parser.add_argument("--history", help="also append the plans to this history file "
+                                          "(.csv, .db for SQLite or .compact)")
+    parser.add_argument("--scale-portions", action="store_true",
+                        help="fit each item's grams to the meal targets")
+    args = parser.parse_args(argv)
+
+    if args.profiles is None:
+        # Only the GUI needs tkinter
+        from gui import main as gui_main
+        gui_main()
+        return
+
+    try:
+        profiles = load_profiles(args.profiles)
+    except (OSError, ValueError) as e:
+        parser.error(f"could not read profiles: {e}")
+
+    try:
+        planner = DietPlanner(history=NullHistoryBackend(), food_source=args.foods)
+    except (OSError, ValueError) as e:
+        parser.error(f"could not load foods: {e}")
+    if args.history:
         try:
-            self.history_text.delete(1.0, tk.END)
-            with open('meal_history.csv', 'r') as file:
-                reader = csv.reader(file)
-                for row in reader:
-                    date, summary = row
-                    self.history_text.insert(tk.END, f"Date: {date}\n")
-                    summary_dict = json.loads(summary)
-                    self.history_text.insert(tk.END, f"Calories: {summary_dict['total_nutrition']['calories']} kcal\n")
-                    self.history_text.insert(tk.END, "-"*40 + "\n")
-        except FileNotFoundError:
-            self.history_text.insert(tk.END, "No history available yet.")
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to load history: {str(e)}")
-
-def main():
-    root = tk.Tk()
-    app = DietPlannerGUI(root)
-    root.mainloop()
+            planner.history = open_history(args.history, planner.food_table)
+        except (OSError, ValueError) as e:
+            parser.error(f"could not open history: {e}")
+    if args.seed is not None:
+        planner.rng = np.random.default_rng(args.seed)
+    plan_args = dict(mode=args.mode, time_budget=args.time_budget, samples=args.samples)
+    if args.scale_portions:
+        meal_plans, portions = planner.generate_scaled_meal_plans(profiles, **plan_args)
+    else:
+        meal_plans = planner.generate_meal_plans(profiles, **plan_args)
+        portions = [None] * len(meal_plans)
+
+    output = open(args.output, 'w') if args.output else sys.stdout
+    try:
+        for profile, meal_plan, plan_portions in zip(profiles, meal_plans, portions):
+            output.write(json.dumps({
+                "daily_needs": planner.calculate_daily_needs(profile),
+                "summary": planner.get_meal_plan_summary(meal_plan, plan_portions)
+            }) + "\n")
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+def __getattr__(name: str):
+    # DietPlannerGUI moved to gui.py; import it lazily so tkinter stays optional
+    if name == "DietPlannerGUI":
+        from gui import DietPlannerGUI
+        return DietPlannerGUI
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,83 @@
+import json
+import mmap
+import os
+import struct
+from typing import Dict, Tuple
+import numpy as np
+
+# Binary columnar cache layout:
+#   MAGIC, format version (uint32), reserved (uint32), header length (uint64),
+#   JSON header, then each column's raw bytes at a 64-byte aligned offset.
+MAGIC = b"FOODCACH"
+FORMAT_VERSION = 1
+ALIGN = 64
+_PREFIX = struct.Struct("<8sIIQ")
+
+class CacheFormatError(ValueError):
+    """Raised when a file is not a food cache of the current format version."""
+
+def _aligned(offset: int) -> int:
+    return -(-offset // ALIGN) * ALIGN
+
+def write_columns(path: str, meta: Dict, columns: Dict[str, np.ndarray]):
+    """Write named arrays and a JSON-serializable meta dict to one cache file.
+
+    The file is written next to ``path`` and renamed into place, so readers
+    never see a partial cache.
+    """
+    columns = {name: np.ascontiguousarray(array) for name, array in columns.items()}
+    # Offsets depend on the header length, which depends on the offsets
+    layout, header = {}, b""
+    while True:
+        offset = _aligned(_PREFIX.size + len(header))
+        for name, array in columns.items():
+            layout[name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+            offset = _aligned(offset + array.nbytes)
+        encoded = json.dumps({"meta": meta, "columns": layout}).encode()
+        if len(encoded) == len(header):
+            break
+        header = encoded
+
+    temporary = path + ".tmp"
+    with open(temporary, 'wb') as file:
+        file.write(_PREFIX.pack(MAGIC, FORMAT_VERSION, 0, len(header)))
+        file.write(header)
+        for name, array in columns.items():
+            file.seek(layout[name]["offset"])
+            file.write(array.tobytes())
+        file.truncate(max([_PREFIX.size + len(header)] +
+                          [layout[name]["offset"] + array.nbytes for name, array in columns.items()]))
+    os.replace(temporary, path)
+
+def read_columns(path: str) -> Tuple[Dict, Dict[str, np.ndarray]]:
+    """Memory-map a cache file and return its meta dict and read-only column arrays.
+
+    Raises CacheFormatError if the file is of another format version,
+    truncated or otherwise damaged.
+    """
+    with open(path, 'rb') as file:
+        prefix = file.read(_PREFIX.size)
+        if len(prefix) < _PREFIX.size:
+            raise CacheFormatError(f"{path} is truncated")
+        magic, version, _, header_length = _PREFIX.unpack(prefix)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise CacheFormatError(f"{path} is not a version {FORMAT_VERSION} food cache")
+        try:
+            header = json.loads(file.read(header_length))
+            meta, layout = header["meta"], header["columns"]
+        except (ValueError, KeyError, TypeError) as e:
+            raise CacheFormatError(f"{path} has a damaged header: {e!r}")
+        mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    columns = {}
+    for name, spec in layout.items():
+        try:
+            dtype = np.dtype(spec["dtype"])
+            shape = [int(size) for size in spec["shape"]]
+            offset = int(spec["offset"])
+        except (KeyError, TypeError, ValueError) as e:
+            raise CacheFormatError(f"{path} has a damaged entry for column {name}: {e!r}")
+        count = int(np.prod(shape, dtype=np.int64))
+        if min(shape, default=0) < 0 or offset < 0 or offset + count * dtype.itemsize > len(mapping):
+            raise CacheFormatError(f"{path} is truncated: column {name} lies outside the file")
+        columns[name] = np.frombuffer(mapping, dtype=dtype, count=count, offset=offset).reshape(shape)
+    return meta, columns
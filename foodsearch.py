@@ -0,0 +1,246 @@
+import re
+from bisect import bisect_left
+from collections import defaultdict
+from typing import Dict, Iterable, List
+import numpy as np
+
+_WORD = re.compile(r"\w+")
+
+def _trigrams(word: str) -> List[str]:
+    padded = f"^{word}$"
+    return list({padded[i:i + 3] for i in range(len(padded) - 2)})
+
+def edit_distance(a: str, b: str, limit: int, prefix: bool = False) -> int:
+    """Levenshtein distance between a and b, or ``limit + 1`` once it exceeds limit.
+
+    With ``prefix`` the distance is to the closest prefix of b, of any length.
+    """
+    if len(a) - len(b) > limit or (len(b) - len(a) > limit and not prefix):
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1,
+                               previous[j - 1] + (char_a != char_b)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return min(min(previous) if prefix else previous[-1], limit + 1)
+
+class FoodSearchIndex:
+    """Prefix and typo-tolerant search over food names.
+
+    Names are split into lower-cased words. The distinct words are kept
+    sorted for prefix lookups by bisection, each word has a posting array
+    of the names that contain it, and a trigram index over the words finds
+    near-misses for typos, so a misspelt word must still share a trigram
+    with the word it stands for. A query only touches the postings of the
+    words it matches, never the full name list.
+    """
+
+    # Word match scores; a name scores the sum over the query's words
+    EXACT, PREFIX, FUZZY = 3, 2, 1
+    # A short prefix can match thousands of words; only the shortest are expanded
+    MAX_EXPANSIONS = 64
+    MAX_FUZZY_CANDIDATES = 32
+    # Word sets with more postings than this fraction of all names are
+    # scattered into a dense score array instead of sorted or searched
+    DENSE_FRACTION = 1 / 64
+
+    def __init__(self, names: Iterable[str]):
+        postings = defaultdict(list)
+        name_lengths = []
+        for i, name in enumerate(names):
+            name_lengths.append(len(name))
+            for word in dict.fromkeys(_WORD.findall(name.lower())):
+                postings[word].append(i)
+        name_lengths = np.array(name_lengths, dtype=np.int32)
+        # Names are numbered by rank (shorter first, then by index) so every
+        # sorted posting array is also in result order
+        self.by_rank = np.lexsort((np.arange(len(name_lengths)), name_lengths))
+        rank_of = np.empty(len(name_lengths), dtype=np.int32)
+        rank_of[self.by_rank] = np.arange(len(name_lengths), dtype=np.int32)
+
+        self.words = sorted(postings)
+        self.word_lengths = np.array([len(word) for word in self.words], dtype=np.int32)
+        # Ranks of the names containing word i are ranks[offsets[i]:offsets[i + 1]]
+        self.word_counts = np.array([len(postings[word]) for word in self.words], dtype=np.int64)
+        self.offsets = np.zeros(len(self.words) + 1, dtype=np.int64)
+        np.cumsum(self.word_counts, out=self.offsets[1:])
+        self.ranks = np.concatenate(
+            [np.sort(rank_of[postings[word]]) for word in self.words]
+        ) if self.words else np.empty(0, dtype=np.int32)
+
+        grams = defaultdict(list)
+        for word_id, word in enumerate(self.words):
+            for gram in _trigrams(word):
+                grams[gram].append(word_id)
+        self.grams = {gram: np.array(ids, dtype=np.int32) for gram, ids in grams.items()}
+
+    def __len__(self) -> int:
+        return len(self.by_rank)
+
+    def _prefix_range(self, prefix: str) -> range:
+        start = bisect_left(self.words, prefix)
+        end = bisect_left(self.words, prefix + "\U0010ffff", start)
+        return range(start, end)
+
+    def _fuzzy_words(self, token: str, prefix: bool) -> List[int]:
+        """Return ids of words within a small edit distance of token."""
+        if len(token) < 3:
+            return []
+        limit = 1 if len(token) <= 5 else 2
+        lists = [self.grams[gram] for gram in _trigrams(token) if gram in self.grams]
+        if not lists:
+            return []
+        shared = np.bincount(np.concatenate(lists), minlength=len(self.words))
+        candidates = np.flatnonzero(shared >= max(1, len(lists) - 3 * limit))
+        if len(candidates) > self.MAX_FUZZY_CANDIDATES:
+            best = np.argpartition(-shared[candidates], self.MAX_FUZZY_CANDIDATES)
+            candidates = candidates[best[:self.MAX_FUZZY_CANDIDATES]]
+        matches = []
+        for word_id in candidates.tolist():
+            word = self.words[word_id]
+            if edit_distance(token, word, limit, prefix) <= limit:
+                matches.append(word_id)
+        return matches
+
+    def match_words(self, token: str, prefix: bool = False) -> Dict[int, int]:
+        """Return {word id: score} for the words a query token matches."""
+        scores = {}
+        if prefix:
+            matches = self._prefix_range(token)
+            if len(matches) > self.MAX_EXPANSIONS:
+                ids = np.arange(matches.start, matches.stop)
+                shortest = np.argpartition(self.word_lengths[ids], self.MAX_EXPANSIONS)
+                matches = ids[shortest[:self.MAX_EXPANSIONS]].tolist()
+            for word_id in matches:
+                scores[word_id] = self.PREFIX
+        for word_id in self._fuzzy_words(token, prefix):
+            scores.setdefault(word_id, self.FUZZY)
+        word_id = bisect_left(self.words, token)
+        if word_id < len(self.words) and self.words[word_id] == token:
+            scores[word_id] = self.EXACT
+        return scores
+
+    def _postings(self, word_id: int, limit: int = None) -> np.ndarray:
+        start, end = self.offsets[word_id], self.offsets[word_id + 1]
+        return self.ranks[start:end if limit is None else min(end, start + limit)]
+
+    def _best_ranks(self, word_scores: Dict[int, int], limit: int) -> np.ndarray:
+        """Top ranks for a single query word: best score first, then lowest rank.
+
+        Postings are in rank order, so each word only contributes its first
+        ``limit`` entries.
+        """
+        selected = np.empty(0, dtype=np.int32)
+        for score in sorted(set(word_scores.values()), reverse=True):
+            heads = [self._postings(word_id, limit)
+                     for word_id, word_score in word_scores.items() if word_score == score]
+            candidates = np.unique(np.concatenate(heads))
+            candidates = candidates[~np.isin(candidates, selected, assume_unique=True)]
+            selected = np.concatenate([selected, candidates[:limit - len(selected)]])
+            if len(selected) >= limit:
+                break
+        return selected
+
+    def _dense_scores(self, word_scores: Dict[int, int]) -> np.ndarray:
+        """Best word score of every name, as one array indexed by rank."""
+        scores = np.zeros(len(self.by_rank), dtype=np.int8)
+        # Lower scores first so higher ones overwrite them
+        for word_id, score in sorted(word_scores.items(), key=lambda item: item[1]):
+            scores[self._postings(word_id)] = score
+        return scores
+
+    def _posting_count(self, word_scores: Dict[int, int]) -> int:
+        return int(self.word_counts[list(word_scores)].sum())
+
+    def _use_dense(self, word_scores: Dict[int, int]) -> bool:
+        return self._posting_count(word_scores) > len(self.by_rank) * self.DENSE_FRACTION
+
+    def _ranks_of(self, word_scores: Dict[int, int]):
+        """Return the sorted ranks of names containing any of the words, with their best score."""
+        if len(word_scores) == 1:
+            (word_id, score), = word_scores.items()
+            ranks = self._postings(word_id)
+            return ranks, np.full(len(ranks), score, dtype=np.int32)
+        if self._use_dense(word_scores):
+            scores = self._dense_scores(word_scores)
+            ranks = np.flatnonzero(scores)
+            return ranks, scores[ranks].astype(np.int32)
+        word_ids = np.fromiter(word_scores, dtype=np.int64, count=len(word_scores))
+        scores = np.fromiter(word_scores.values(), dtype=np.int32, count=len(word_scores))
+        ranks = np.concatenate([self._postings(word_id) for word_id in word_ids.tolist()])
+        rank_scores = np.repeat(scores, self.word_counts[word_ids])
+        order = np.lexsort((-rank_scores, ranks))
+        ranks, rank_scores = ranks[order], rank_scores[order]
+        first = np.ones(len(ranks), dtype=bool)
+        first[1:] = ranks[1:] != ranks[:-1]
+        return ranks[first], rank_scores[first]
+
+    def _token_scores(self, ranks: np.ndarray, word_scores: Dict[int, int]) -> np.ndarray:
+        """Score each candidate rank by its best matching word; 0 where none matches."""
+        if self._use_dense(word_scores):
+            return self._dense_scores(word_scores)[ranks]
+        scores = np.zeros(len(ranks), dtype=np.int32)
+        for word_id, score in word_scores.items():
+            postings = self._postings(word_id)
+            # Search the shorter array in the longer one
+            if len(postings) < len(ranks):
+                positions = np.searchsorted(ranks, postings)
+                found = positions < len(ranks)
+                found[found] = ranks[positions[found]] == postings[found]
+                hit = np.zeros(len(ranks), dtype=bool)
+                hit[positions[found]] = True
+            else:
+                positions = np.minimum(np.searchsorted(postings, ranks), len(postings) - 1)
+                hit = postings[positions] == ranks if len(postings) else np.zeros(len(ranks), dtype=bool)
+            np.maximum(scores, np.where(hit, score, 0), out=scores)
+        return scores
+
+    def search(self, query: str, limit: int = 10) -> np.ndarray:
+        """Return indices of up to ``limit`` names matching every word of the query.
+
+        The last word is also matched as a prefix unless the query ends in
+        whitespace, and words may contain small typos. Results are ranked
+        by summed word match score, then by shorter name.
+        """
+        tokens = _WORD.findall(query.lower())
+        if not tokens:
+            return np.empty(0, dtype=np.intp)
+        partial = not query[-1].isspace()
+        matches = [self.match_words(token, prefix=partial and number == len(tokens) - 1)
+                   for number, token in enumerate(tokens)]
+        if not all(matches):
+            return np.empty(0, dtype=np.intp)
+        if len(matches) == 1:
+            return self.by_rank[self._best_ranks(matches[0], limit)].astype(np.intp)
+
+        # Start from the query word with the fewest candidate names and
+        # narrow down with the others
+        matches.sort(key=self._posting_count)
+        ranks, scores = self._ranks_of(matches[0])
+        for word_scores in matches[1:]:
+            token_scores = self._token_scores(ranks, word_scores)
+            keep = token_scores > 0
+            ranks, scores = ranks[keep], scores[keep] + token_scores[keep]
+            if not len(ranks):
+                return np.empty(0, dtype=np.intp)
+
+        # Best score first, then lowest rank; only the top ``limit`` need sorting
+        key = -scores.astype(np.int64) * len(self.by_rank) + ranks
+        if len(key) > limit:
+            key = key[np.argpartition(key, limit)[:limit]]
+        key.sort()
+        return self.by_rank[key % len(self.by_rank)].astype(np.intp)
+
+    def complete_word(self, prefix: str, limit: int = 10) -> List[str]:
+        """Return words starting with prefix (or close to it), most common first."""
+        prefix = prefix.strip().lower()
+        if not prefix:
+            return []
+        word_ids = list(self._prefix_range(prefix)) or self._fuzzy_words(prefix, prefix=True)
+        word_ids = np.array(word_ids, dtype=np.int64)
+        order = np.lexsort((word_ids, -self.word_counts[word_ids]))[:limit]
+        return [self.words[i] for i in word_ids[order]]
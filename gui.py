@@ -0,0 +1,466 @@
+import tkinter as tk
+from tkinter import ttk, messagebox
+from typing import Dict
+from collections import deque
+import queue
+import threading
+from app import DietPlanner, PlanCancelled
+
+class DietPlannerGUI:
+    HISTORY_PAGE_SIZE = 100
+    HISTORY_MAX_PAGES = 5
+    # Worker results are polled at roughly 60 fps
+    POLL_INTERVAL_MS = 16
+    OPTIMIZE_TIME_BUDGET = 1.0
+    SUGGESTION_COUNT = 10
+    # Keys that move through a suggestion list rather than edit the text
+    NAVIGATION_KEYS = ('Up', 'Down', 'Return', 'Escape', 'Tab')
+
+    def __init__(self, root):
+        self.root = root
+        self.root.title("AI Diet Planner")
+        self.planner = DietPlanner()
+        # Build the name search index up front so typing never waits for it
+        self.search_index = self.planner.food_table.search_index
+        
+        # Create main notebook for tabs
+        self.notebook = ttk.Notebook(root)
+        self.notebook.pack(fill='both', expand=True, padx=10, pady=5)
+        
+        # Create tabs
+        self.profile_tab = ttk.Frame(self.notebook)
+        self.meal_plan_tab = ttk.Frame(self.notebook)
+        self.history_tab = ttk.Frame(self.notebook)
+        
+        self.notebook.add(self.profile_tab, text='Profile')
+        self.notebook.add(self.meal_plan_tab, text='Meal Plan')
+        self.notebook.add(self.history_tab, text='History')
+        
+        self._setup_profile_tab()
+        self._setup_meal_plan_tab()
+        self._setup_history_tab()
+
+    def _setup_profile_tab(self):
+        # Personal Information Frame
+        info_frame = ttk.LabelFrame(self.profile_tab, text="Personal Information")
+        info_frame.pack(fill='x', padx=10, pady=5)
+        
+        # Weight
+        ttk.Label(info_frame, text="Weight (kg):").grid(row=0, column=0, padx=5, pady=5)
+        self.weight_var = tk.StringVar()
+        ttk.Entry(info_frame, textvariable=self.weight_var).grid(row=0, column=1, padx=5, pady=5)
+        
+        # Height
+        ttk.Label(info_frame, text="Height (cm):").grid(row=1, column=0, padx=5, pady=5)
+        self.height_var = tk.StringVar()
+        ttk.Entry(info_frame, textvariable=self.height_var).grid(row=1, column=1, padx=5, pady=5)
+        
+        # Age
+        ttk.Label(info_frame, text="Age:").grid(row=2, column=0, padx=5, pady=5)
+        self.age_var = tk.StringVar()
+        ttk.Entry(info_frame, textvariable=self.age_var).grid(row=2, column=1, padx=5, pady=5)
+        
+        # Gender
+        # Gender
+        ttk.Label(info_frame, text="Gender:").grid(row=3, column=0, padx=5, pady=5)
+        self.gender_var = tk.StringVar()
+        gender_combo = ttk.Combobox(info_frame, textvariable=self.gender_var)
+        gender_combo['values'] = ('Male', 'Female')
+        gender_combo.grid(row=3, column=1, padx=5, pady=5)
+        
+        # Activity Level
+        ttk.Label(info_frame, text="Activity Level:").grid(row=4, column=0, padx=5, pady=5)
+        self.activity_var = tk.StringVar()
+        activity_combo = ttk.Combobox(info_frame, textvariable=self.activity_var)
+        activity_combo['values'] = ('Sedentary', 'Light', 'Moderate', 'Very Active', 'Extra Active')
+        activity_combo.grid(row=4, column=1, padx=5, pady=5)
+        
+        # Goal
+        ttk.Label(info_frame, text="Goal:").grid(row=5, column=0, padx=5, pady=5)
+        self.goal_var = tk.StringVar()
+        goal_combo = ttk.Combobox(info_frame, textvariable=self.goal_var)
+        goal_combo['values'] = ('Lose', 'Maintain', 'Gain')
+        goal_combo.grid(row=5, column=1, padx=5, pady=5)
+        
+        # Meals per day
+        ttk.Label(info_frame, text="Meals per day:").grid(row=6, column=0, padx=5, pady=5)
+        self.meals_var = tk.StringVar(value="3")
+        meals_spin = ttk.Spinbox(info_frame, from_=2, to=6, textvariable=self.meals_var)
+        meals_spin.grid(row=6, column=1, padx=5, pady=5)
+        
+        # Dietary Restrictions Frame
+        restrictions_frame = ttk.LabelFrame(self.profile_tab, text="Dietary Restrictions")
+        restrictions_frame.pack(fill='x', padx=10, pady=5)
+        
+        # Dietary Restrictions
+        self.vegan_var = tk.BooleanVar()
+        ttk.Checkbutton(restrictions_frame, text="Vegan", variable=self.vegan_var).grid(row=0, column=0, padx=5, pady=5)
+        
+        self.vegetarian_var = tk.BooleanVar()
+        ttk.Checkbutton(restrictions_frame, text="Vegetarian", variable=self.vegetarian_var).grid(row=0, column=1, padx=5, pady=5)
+        
+        self.gluten_free_var = tk.BooleanVar()
+        ttk.Checkbutton(restrictions_frame, text="Gluten-Free", variable=self.gluten_free_var).grid(row=0, column=2, padx=5, pady=5)
+        
+        # Allergies Frame
+        allergies_frame = ttk.LabelFrame(self.profile_tab, text="Allergies")
+        allergies_frame.pack(fill='x', padx=10, pady=5)
+        
+        ttk.Label(allergies_frame, text="List allergies (comma-separated):").grid(row=0, column=0, padx=5, pady=5)
+        self.allergies_var = tk.StringVar()
+        # Suggests ingredient words from food names for the allergy being typed
+        self.allergies_combo = ttk.Combobox(allergies_frame, textvariable=self.allergies_var, width=40)
+        self.allergies_combo.grid(row=0, column=1, padx=5, pady=5)
+        self.allergies_combo.bind('<KeyRelease>', self._suggest_allergies)
+        
+        # Save Button
+        save_button = ttk.Button(self.profile_tab, text="Save Profile", command=self.save_profile)
+        save_button.pack(pady=10)
+
+    def _setup_meal_plan_tab(self):
+        controls = ttk.Frame(self.meal_plan_tab)
+        controls.pack(pady=10)
+        
+        # Generation Mode
+        ttk.Label(controls, text="Mode:").pack(side='left', padx=5)
+        self.mode_var = tk.StringVar(value="Random")
+        mode_combo = ttk.Combobox(controls, textvariable=self.mode_var, state='readonly', width=10)
+        mode_combo['values'] = ('Random', 'Sample', 'Optimize')
+        mode_combo.pack(side='left', padx=5)
+        self.scale_portions_var = tk.BooleanVar()
+        ttk.Checkbutton(controls, text="Scale portions", variable=self.scale_portions_var).pack(side='left', padx=5)
+        
+        # Generate Plan and Cancel Buttons
+        self.generate_button = ttk.Button(controls, text="Generate Meal Plan", command=self.generate_meal_plan)
+        self.generate_button.pack(side='left', padx=5)
+        self.cancel_button = ttk.Button(controls, text="Cancel", command=self.cancel_generation, state='disabled')
+        self.cancel_button.pack(side='left', padx=5)
+        
+        # Food Search
+        search_frame = ttk.Frame(self.meal_plan_tab)
+        search_frame.pack(fill='x', padx=10)
+        ttk.Label(search_frame, text="Find food:").pack(side='left', padx=5)
+        self.food_search_var = tk.StringVar()
+        self.food_search_combo = ttk.Combobox(search_frame, textvariable=self.food_search_var, width=40)
+        self.food_search_combo.pack(side='left', padx=5, fill='x', expand=True)
+        self.food_search_combo.bind('<KeyRelease>', self._suggest_foods)
+        self.food_search_combo.bind('<<ComboboxSelected>>', self._show_found_food)
+        self.food_search_combo.bind('<Return>', self._show_found_food)
+        self.food_details_label = ttk.Label(self.meal_plan_tab, justify='left', wraplength=500)
+        self.food_details_label.pack(fill='x', padx=10, pady=5)
+        
+        # Generation Progress
+        self.progress_bar = ttk.Progressbar(self.meal_plan_tab, mode='determinate', maximum=1.0)
+        self.progress_bar.pack(fill='x', padx=10)
+        self.generation_events = None
+        self.cancel_event = None
+        
+        # Meal Plan Display
+        self.meal_plan_text = tk.Text(self.meal_plan_tab, height=20, width=50)
+        self.meal_plan_text.pack(padx=10, pady=5, fill='both', expand=True)
+        
+        # Export Button
+        export_button = ttk.Button(self.meal_plan_tab, text="Export Meal Plan", command=self.export_meal_plan)
+        export_button.pack(pady=10)
+
+    def _setup_history_tab(self):
+        # Weekly Trends
+        self.trends_label = ttk.Label(self.history_tab, justify='left')
+        self.trends_label.pack(fill='x', padx=10, pady=5)
+        
+        # History Table; pages are fetched as the view nears either end and
+        # pages far from the view are dropped, so only a window of rows exists
+        table_frame = ttk.Frame(self.history_tab)
+        table_frame.pack(padx=10, pady=5, fill='both', expand=True)
+        columns = ('date', 'calories', 'protein', 'carbs', 'fats')
+        self.history_tree = ttk.Treeview(table_frame, columns=columns, show='headings', height=20)
+        for column in columns:
+            self.history_tree.heading(column, text=column.title())
+            self.history_tree.column(column, width=90, anchor='w' if column == 'date' else 'e')
+        self.history_scrollbar = ttk.Scrollbar(table_frame, orient='vertical', command=self.history_tree.yview)
+        self.history_tree.configure(yscrollcommand=self._on_history_scroll)
+        self.history_tree.pack(side='left', fill='both', expand=True)
+        self.history_scrollbar.pack(side='right', fill='y')
+        self.history_page_starts = [None]
+        self.history_pages = deque()
+        self.history_fetch_pending = False
+        
+        # Refresh Button
+        refresh_button = ttk.Button(self.history_tab, text="Refresh History", command=self.load_history)
+        refresh_button.pack(pady=10)
+
+    def save_profile(self):
+        previous_fingerprint = self.planner.user_profile.fingerprint()
+        try:
+            self.planner.user_profile.weight = float(self.weight_var.get())
+            self.planner.user_profile.height = float(self.height_var.get())
+            self.planner.user_profile.age = int(self.age_var.get())
+            self.planner.user_profile.gender = self.gender_var.get()
+            self.planner.user_profile.activity_level = self.activity_var.get().lower()
+            self.planner.user_profile.goal = self.goal_var.get().lower()
+            self.planner.user_profile.meals_per_day = int(self.meals_var.get())
+            
+            # Get dietary restrictions
+            restrictions = []
+            if self.vegan_var.get():
+                restrictions.append("vegan")
+            if self.vegetarian_var.get():
+                restrictions.append("vegetarian")
+            if self.gluten_free_var.get():
+                restrictions.append("gluten-free")
+            self.planner.user_profile.dietary_restrictions = restrictions
+            
+            # Get allergies
+            allergies = [a.strip() for a in self.allergies_var.get().split(',') if a.strip()]
+            self.planner.user_profile.allergies = allergies
+            self.planner.invalidate_profile_cache(previous_fingerprint)
+            
+            messagebox.showinfo("Success", "Profile saved successfully!")
+            
+        except ValueError as e:
+            messagebox.showerror("Error", "Please enter valid numeric values for weight, height, and age.")
+
+    def _suggest_allergies(self, event):
+        if event.keysym in self.NAVIGATION_KEYS:
+            return
+        done, _, current = self.allergies_var.get().rpartition(',')
+        words = self.search_index.complete_word(current, self.SUGGESTION_COUNT)
+        prefix = done + ", " if done else ""
+        self.allergies_combo['values'] = [prefix + word for word in words]
+
+    def _suggest_foods(self, event):
+        if event.keysym in self.NAVIGATION_KEYS:
+            return
+        matches = self.planner.search_foods(self.food_search_var.get(), self.SUGGESTION_COUNT)
+        names = self.planner.food_table.names
+        self.food_search_combo['values'] = [names[i] for i in matches]
+
+    def _show_found_food(self, event=None):
+        matches = self.planner.search_foods(self.food_search_var.get(), 1)
+        if not len(matches):
+            self.food_details_label.configure(text="No matching food.")
+            return
+        table = self.planner.food_table
+        food = int(matches[0])
+        calories, protein, carbs, fats = table.nutrients[:, food]
+        substitutes = self.planner.suggest_substitutes(food, 3)
+        lines = [
+            f"{table.names[food]} ({table.portions[food]}): {calories:.0f} kcal, "
+            f"{protein:.0f}g protein, {carbs:.0f}g carbs, {fats:.0f}g fats"
+        ]
+        if len(substitutes):
+            lines.append("Similar: " + ", ".join(table.names[i] for i in substitutes))
+        self.food_details_label.configure(text="\n".join(lines))
+
+    def generate_meal_plan(self):
+        if not self.planner.user_profile.weight:
+            messagebox.showwarning("Warning", "Please save your profile first!")
+            return
+        if self.generation_events is not None:
+            return
+        
+        # Generate in a worker thread; results come back through a queue polled with after()
+        self.cancel_event = threading.Event()
+        self.generation_events = queue.Queue()
+        worker = threading.Thread(
+            target=self._generation_worker,
+            args=(self.mode_var.get().lower(), self.scale_portions_var.get(),
+                  self.cancel_event, self.generation_events),
+            daemon=True
+        )
+        self.progress_bar['value'] = 0
+        self.generate_button.state(['disabled'])
+        self.cancel_button.state(['!disabled'])
+        worker.start()
+        self.root.after(self.POLL_INTERVAL_MS, self._poll_generation)
+
+    def cancel_generation(self):
+        if self.cancel_event is not None:
+            self.cancel_event.set()
+
+    def _generation_worker(self, mode: str, scale_portions: bool, cancel_event: threading.Event,
+                           events: queue.Queue):
+        """Runs off the Tk thread; never touches widgets."""
+        try:
+            plan_args = dict(
+                mode=mode, time_budget=self.OPTIMIZE_TIME_BUDGET, cancel_event=cancel_event,
+                progress=lambda fraction: events.put(("progress", fraction))
+            )
+            if scale_portions:
+                meal_plan, portions = self.planner.generate_scaled_meal_plan(**plan_args)
+            else:
+                meal_plan, portions = self.planner.generate_meal_plan(**plan_args), None
+            events.put(("done", self.planner.get_meal_plan_summary(meal_plan, portions)))
+        except PlanCancelled:
+            events.put(("cancelled", None))
+        except Exception as e:
+            events.put(("error", e))
+
+    def _poll_generation(self):
+        try:
+            while True:
+                kind, value = self.generation_events.get_nowait()
+                if kind == "progress":
+                    self.progress_bar['value'] = value
+                    continue
+                self.generation_events = None
+                self.cancel_event = None
+                self.generate_button.state(['!disabled'])
+                self.cancel_button.state(['disabled'])
+                if kind == "done":
+                    self.progress_bar['value'] = 1.0
+                    self._show_meal_plan(value)
+                elif kind == "cancelled":
+                    self.progress_bar['value'] = 0
+                else:
+                    messagebox.showerror("Error", f"Failed to generate meal plan: {str(value)}")
+                return
+        except queue.Empty:
+            self.root.after(self.POLL_INTERVAL_MS, self._poll_generation)
+
+    def _show_meal_plan(self, summary: Dict):
+        # Build the whole meal plan text, then render it with one insert
+        totals = summary["total_nutrition"]
+        lines = [
+            "Your Meal Plan\n",
+            "Daily Totals:",
+            f"Calories: {totals['calories']} kcal",
+            f"Protein: {totals['protein']}g",
+            f"Carbs: {totals['carbs']}g",
+            f"Fats: {totals['fats']}g\n",
+        ]
+        for meal in summary["meals"]:
+            lines.append(f"\nMeal {meal['meal_number']}:")
+            lines.extend(f"- {food['name']} ({self._portion_text(food)})" for food in meal["foods"])
+            nutrition = meal["nutrition"]
+            lines.extend([
+                "\nMeal Nutrition:",
+                f"Calories: {nutrition['calories']} kcal",
+                f"Protein: {nutrition['protein']}g",
+                f"Carbs: {nutrition['carbs']}g",
+                f"Fats: {nutrition['fats']}g",
+                "\n" + "-"*40,
+            ])
+        
+        self.meal_plan_text.delete(1.0, tk.END)
+        self.meal_plan_text.insert(tk.END, "\n".join(lines) + "\n")
+
+    @staticmethod
+    def _portion_text(food: Dict) -> str:
+        if "servings" not in food:
+            return food['portion']
+        if food["grams"] is None:
+            return f"{food['servings']} x {food['portion']}"
+        return f"{food['grams']}g"
+
+    def export_meal_plan(self):
+        try:
+            content = self.meal_plan_text.get(1.0, tk.END)
+            with open('meal_plan.txt', 'w') as f:
+                f.write(content)
+            messagebox.showinfo("Success", "Meal plan exported to meal_plan.txt")
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to export meal plan: {str(e)}")
+
+    def load_history(self):
+        self.history_tree.delete(*self.history_tree.get_children())
+        # Cursor of every page start seen so far, and the (page number, row ids) on screen
+        self.history_page_starts = [None]
+        self.history_pages = deque()
+        self._load_history_page(0, at_end=True)
+        if not self.history_tree.get_children():
+            self.trends_label.configure(text="No history available yet.")
+            return
+        # A missing rollup store is rebuilt from the whole history, so query it in a worker thread
+        self.trends_label.configure(text="Loading weekly averages...")
+        events = queue.Queue()
+        worker = threading.Thread(target=self._trends_worker, args=(events,), daemon=True)
+        worker.start()
+        self.root.after(self.POLL_INTERVAL_MS, self._poll_trends, events)
+
+    def _trends_worker(self, events: queue.Queue):
+        try:
+            rollups = self.planner.history.rollups
+            events.put(("done", rollups.query("week")[-4:] if rollups is not None else []))
+        except Exception as e:
+            events.put(("error", e))
+
+    def _poll_trends(self, events: queue.Queue):
+        try:
+            kind, value = events.get_nowait()
+        except queue.Empty:
+            self.root.after(self.POLL_INTERVAL_MS, self._poll_trends, events)
+            return
+        if kind == "error":
+            self.trends_label.configure(text="")
+            messagebox.showerror("Error", f"Failed to load weekly averages: {str(value)}")
+            return
+        lines = ["Weekly Averages:"] if value else []
+        for week in value:
+            lines.append(
+                f"{week['bucket']}: {week['calories']['mean']:.0f} kcal, "
+                f"{week['protein']['mean']:.0f}g protein ({week['count']} plans)"
+            )
+        self.trends_label.configure(text="\n".join(lines))
+
+    def _on_history_scroll(self, first: str, last: str):
+        self.history_scrollbar.set(first, last)
+        if self.history_fetch_pending:
+            return
+        if float(last) > 0.9 or float(first) < 0.1:
+            self.history_fetch_pending = True
+            self.root.after_idle(self._fetch_history_near_view)
+
+    def _fetch_history_near_view(self):
+        self.history_fetch_pending = False
+        if not self.history_pages:
+            return
+        first, last = self.history_tree.yview()
+        next_page = self.history_pages[-1][0] + 1
+        previous_page = self.history_pages[0][0] - 1
+        if last > 0.9 and next_page < len(self.history_page_starts):
+            self._load_history_page(next_page, at_end=True)
+        elif first < 0.1 and previous_page >= 0:
+            self._load_history_page(previous_page, at_end=False)
+
+    def _load_history_page(self, number: int, at_end: bool):
+        try:
+            entries, next_cursor = self.planner.history.page(
+                self.history_page_starts[number], self.HISTORY_PAGE_SIZE
+            )
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to load history: {str(e)}")
+            return
+        if number + 1 == len(self.history_page_starts) and next_cursor is not None:
+            self.history_page_starts.append(next_cursor)
+        
+        tree = self.history_tree
+        rows = [
+            (date, totals['calories'], totals['protein'], totals['carbs'], totals['fats'])
+            for date, totals in entries
+        ]
+        if at_end:
+            ids = [tree.insert('', 'end', values=row) for row in rows]
+            self.history_pages.append((number, ids))
+        else:
+            ids = [tree.insert('', index, values=row) for index, row in enumerate(rows)]
+            self.history_pages.appendleft((number, ids))
+            tree.yview_scroll(len(ids), 'units')
+        
+        # Drop the page furthest from the view to keep the row count bounded
+        if len(self.history_pages) > self.HISTORY_MAX_PAGES:
+            if at_end:
+                _, dropped = self.history_pages.popleft()
+                tree.delete(*dropped)
+                tree.yview_scroll(-len(dropped), 'units')
+            else:
+                _, dropped = self.history_pages.pop()
+                tree.delete(*dropped)
+
+def main():
+    root = tk.Tk()
+    app = DietPlannerGUI(root)
+    root.mainloop()
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
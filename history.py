@@ -0,0 +1,914 @@
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from bisect import bisect_left, bisect_right
+import csv
+from datetime import date as Date
+import io
+import json
+import os
+import queue
+import threading
+import time
+import weakref
+from itertools import islice
+from typing import Dict, Iterator, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: index updates are not serialized across processes
+    fcntl = None
+
+NUTRIENTS = ("calories", "protein", "carbs", "fats")
+
+class HistoryBackend(ABC):
+    """Storage interface for meal plan history.
+
+    Entries are dicts with a ``date`` (``YYYY-MM-DD``) and the ``summary``
+    produced by ``DietPlanner.get_meal_plan_summary``. Date bounds are
+    inclusive and optional.
+    """
+
+    @abstractmethod
+    def append(self, entries: List[Dict]):
+        """Store several history entries in one write."""
+
+    @abstractmethod
+    def iter_entries(self, start_date: str = None, end_date: str = None) -> Iterator[Dict]:
+        """Yield full history entries in insertion order."""
+
+    def iter_totals(self, start_date: str = None, end_date: str = None) -> Iterator[Tuple[str, Dict[str, int]]]:
+        """Yield (date, total nutrition) pairs in insertion order."""
+        for entry in self.iter_entries(start_date, end_date):
+            yield entry["date"], entry["summary"]["total_nutrition"]
+
+    def page(self, cursor=None, page_size: int = 50, start_date: str = None,
+             end_date: str = None) -> Tuple[List[Tuple[str, Dict[str, int]]], Optional[object]]:
+        """Return one page of (date, total nutrition) pairs and the cursor of the next page.
+
+        Pass ``cursor=None`` for the first page; the returned cursor is None
+        once the range is exhausted. Cursors are backend-specific.
+        """
+        skip = cursor or 0
+        items = list(islice(self.iter_totals(start_date, end_date), skip, skip + page_size + 1))
+        if len(items) > page_size:
+            return items[:page_size], skip + page_size
+        return items, None
+
+    @property
+    def rollups(self) -> Optional["NutritionRollups"]:
+        """Running per-day and per-week aggregates maintained for this store, if any."""
+        return None
+
+    def sync(self):
+        """Force previously appended entries onto stable storage."""
+        pass
+
+    def close(self):
+        pass
+
+class NullHistoryBackend(HistoryBackend):
+    """Discards appended entries; for callers that do not keep history."""
+
+    def append(self, entries: List[Dict]):
+        pass
+
+    def iter_entries(self, start_date: str = None, end_date: str = None) -> Iterator[Dict]:
+        return iter(())
+
+def _in_range(date: str, start_date: str, end_date: str) -> bool:
+    return (start_date is None or date >= start_date) and (end_date is None or date <= end_date)
+
+def _fsync(path: str):
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except FileNotFoundError:
+        return
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+class CSVHistoryBackend(HistoryBackend):
+    """The original ``meal_history.csv`` format: one date and summary JSON per row.
+
+    A sidecar ``<path>.idx`` file records the byte offset of every row where
+    the date changes, i.e. where each run of rows with one date starts.
+    Runs are also kept sorted by date in memory, so a date-range read only
+    seeks to and reads the runs of its dates, in file order, whatever order
+    the dates were written in. Before every append and range read the
+    index is caught up with rows written by other instances or processes;
+    appends and index updates are serialized with a lock on the index file.
+    """
+
+    def __init__(self, path: str = "meal_history.csv"):
+        self.path = path
+        self.index_path = path + ".idx"
+        # Date and start offset of every run, in file order
+        self._index_dates = []
+        self._index_offsets = []
+        # The run dates sorted, with each run's number; equal dates stay in file order
+        self._sorted_dates = []
+        self._sorted_runs = []
+        # Bytes of the index file and of the CSV the in-memory index covers
+        self._index_size = 0
+        self._indexed_end = 0
+
+    def append(self, entries: List[Dict]):
+        rows = []
+        for entry in entries:
+            buffer = io.StringIO()
+            csv.writer(buffer).writerow([entry["date"], json.dumps(entry["summary"])])
+            rows.append((entry["date"], buffer.getvalue().encode()))
+        data = b"".join(row for _, row in rows)
+
+        with self._locked_index() as index_file:
+            self._catch_up(index_file)
+            # One O_APPEND write per batch so writers without the lock never interleave rows
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                written = 0
+                while written < len(data):
+                    written += os.write(fd, data[written:])
+                offset = os.lseek(fd, 0, os.SEEK_CUR) - len(data)
+            finally:
+                os.close(fd)
+            # Rows another writer slipped in without the lock are picked up next time
+            if offset == self._indexed_end:
+                self._index_rows(index_file, offset, ((date, len(row)) for date, row in rows))
+
+    def sync(self):
+        _fsync(self.path)
+
+    @contextmanager
+    def _locked_index(self):
+        """Open the index file for appending, holding an exclusive lock on it."""
+        with open(self.index_path, 'a+') as index_file:
+            if fcntl is not None:
+                fcntl.flock(index_file, fcntl.LOCK_EX)
+            try:
+                yield index_file
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(index_file, fcntl.LOCK_UN)
+
+    def _load_index(self):
+        """Bring the in-memory index up to date with the index file and the CSV."""
+        with self._locked_index() as index_file:
+            self._catch_up(index_file)
+
+    def _catch_up(self, index_file):
+        """Read index lines other writers added, then index CSV rows nobody indexed yet."""
+        try:
+            csv_size = os.path.getsize(self.path)
+        except FileNotFoundError:
+            csv_size = 0
+        index_size = os.fstat(index_file.fileno()).st_size
+        if csv_size < self._indexed_end or index_size < self._index_size:
+            # The history was replaced or truncated; index it from scratch
+            index_file.truncate(0)
+            self._index_dates, self._index_offsets = [], []
+            self._sorted_dates, self._sorted_runs = [], []
+            self._index_size = self._indexed_end = index_size = 0
+        if index_size > self._index_size:
+            index_file.seek(self._index_size)
+            for line in index_file.read().splitlines():
+                date, offset = line.split(",")
+                self._add_run(date, int(offset))
+            self._index_size = index_size
+            # Rows after the last date change are not in the index file
+            self._indexed_end = max(self._indexed_end, self._index_offsets[-1])
+        if csv_size > self._indexed_end:
+            rows = self._iter_rows([(self._indexed_end, None)], raw=True)
+            self._index_rows(index_file, self._indexed_end,
+                             ((date, len(line)) for _, date, _, line in rows))
+
+    def _index_rows(self, index_file, offset: int, rows: Iterator[Tuple[str, int]]):
+        """Index (date, row length) pairs of rows stored back to back from a byte offset."""
+        changes = []
+        last_date = self._index_dates[-1] if self._index_dates else None
+        for date, length in rows:
+            if date != last_date:
+                changes.append((date, offset))
+                last_date = date
+            offset += length
+        if changes:
+            index_file.seek(0, os.SEEK_END)
+            index_file.write("".join(f"{date},{change}\n" for date, change in changes))
+            index_file.flush()
+            self._index_size = index_file.tell()
+            for date, change in changes:
+                self._add_run(date, change)
+        self._indexed_end = offset
+
+    def _add_run(self, date: str, offset: int):
+        position = bisect_right(self._sorted_dates, date)
+        self._sorted_dates.insert(position, date)
+        self._sorted_runs.insert(position, len(self._index_dates))
+        self._index_dates.append(date)
+        self._index_offsets.append(offset)
+
+    def _spans(self, start_date: str, end_date: str) -> List[Tuple[int, Optional[int]]]:
+        """Return the (start, end) byte spans of the runs in a date range, in file order.
+
+        Adjacent runs are merged; the last run's span is open-ended (None).
+        """
+        low = 0 if start_date is None else bisect_left(self._sorted_dates, start_date)
+        high = len(self._sorted_dates) if end_date is None else bisect_right(self._sorted_dates, end_date)
+        spans = []
+        for run in sorted(self._sorted_runs[low:high]):
+            start = self._index_offsets[run]
+            end = self._index_offsets[run + 1] if run + 1 < len(self._index_offsets) else None
+            if spans and spans[-1][1] == start:
+                spans[-1] = (spans[-1][0], end)
+            else:
+                spans.append((start, end))
+        return spans
+
+    def _iter_rows(self, spans: List[Tuple[int, Optional[int]]], raw: bool = False) -> Iterator[Tuple]:
+        """Lazily yield (row offset, date, summary JSON) for the rows of (start, end) byte spans.
+
+        An end of None reads to the end of the file. With ``raw`` each
+        tuple also carries the row's bytes.
+        """
+        try:
+            file = open(self.path, 'rb')
+        except FileNotFoundError:
+            return
+        with file:
+            for offset, end in spans:
+                file.seek(offset)
+                while end is None or offset < end:
+                    line = file.readline()
+                    if not line.endswith(b"\n"):
+                        # End of file, or a row still being written by another process
+                        return
+                    date, summary = next(csv.reader([line.decode()]))
+                    yield (offset, date, summary, line) if raw else (offset, date, summary)
+                    offset += len(line)
+
+    def _iter_range(self, start_date: str, end_date: str, offset: int = None) -> Iterator[Tuple[int, str, str]]:
+        """Yield rows in a date range from a byte offset on, reading only the runs of its dates."""
+        offset = offset or 0
+        if start_date is None and end_date is None:
+            # Every row is wanted, so the index is not needed
+            yield from self._iter_rows([(offset, None)])
+            return
+        self._load_index()
+        spans = [(max(start, offset), end) for start, end in self._spans(start_date, end_date)
+                 if end is None or end > offset]
+        for row_offset, date, summary in self._iter_rows(spans):
+            # The open-ended last span may reach rows appended since the index was loaded
+            if _in_range(date, start_date, end_date):
+                yield row_offset, date, summary
+
+    def iter_entries(self, start_date: str = None, end_date: str = None) -> Iterator[Dict]:
+        for _, date, summary in self._iter_range(start_date, end_date):
+            yield {"date": date, "summary": json.loads(summary)}
+
+    def page(self, cursor: int = None, page_size: int = 50, start_date: str = None,
+             end_date: str = None) -> Tuple[List[Tuple[str, Dict[str, int]]], Optional[int]]:
+        """Return one page of totals; the cursor is the byte offset of the next row."""
+        items = []
+        for offset, date, summary in self._iter_range(start_date, end_date, cursor):
+            if len(items) == page_size:
+                return items, offset
+            items.append((date, json.loads(summary)["total_nutrition"]))
+        return items, None
+
+class SQLiteHistoryBackend(HistoryBackend):
+    """Embedded SQLite history store.
+
+    Plan dates and daily totals live in indexed columns of ``plans`` and
+    meal details in ``meals``, so date-range and totals queries never
+    decode a full plan.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS plans (
+            id INTEGER PRIMARY KEY,
+            date TEXT NOT NULL,
+            calories INTEGER NOT NULL,
+            protein INTEGER NOT NULL,
+            carbs INTEGER NOT NULL,
+            fats INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS plans_date ON plans (date);
+        CREATE TABLE IF NOT EXISTS meals (
+            plan_id INTEGER NOT NULL REFERENCES plans (id),
+            meal_number INTEGER NOT NULL,
+            foods TEXT NOT NULL,
+            calories INTEGER NOT NULL,
+            protein INTEGER NOT NULL,
+            carbs INTEGER NOT NULL,
+            fats INTEGER NOT NULL,
+            PRIMARY KEY (plan_id, meal_number)
+        );
+    """
+
+    def __init__(self, path: str = "meal_history.db"):
+        self.path = path
+        # Imported here to keep sqlite3 off the CLI's cold-start path
+        import sqlite3
+        # The connection may be handed to a HistoryWriter thread
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.executescript(self.SCHEMA)
+
+    def append(self, entries: List[Dict]):
+        with self.connection:
+            cursor = self.connection.cursor()
+            for entry in entries:
+                summary = entry["summary"]
+                totals = summary["total_nutrition"]
+                cursor.execute(
+                    "INSERT INTO plans (date, calories, protein, carbs, fats) VALUES (?, ?, ?, ?, ?)",
+                    [entry["date"]] + [totals[nutrient] for nutrient in NUTRIENTS]
+                )
+                plan_id = cursor.lastrowid
+                cursor.executemany(
+                    "INSERT INTO meals VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    [
+                        [plan_id, meal["meal_number"], json.dumps(meal["foods"])]
+                        + [meal["nutrition"][nutrient] for nutrient in NUTRIENTS]
+                        for meal in summary["meals"]
+                    ]
+                )
+
+    def _date_filter(self, start_date: str, end_date: str) -> Tuple[str, List[str]]:
+        clauses, params = [], []
+        if start_date is not None:
+            clauses.append("date >= ?")
+            params.append(start_date)
+        if end_date is not None:
+            clauses.append("date <= ?")
+            params.append(end_date)
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+    def iter_totals(self, start_date: str = None, end_date: str = None) -> Iterator[Tuple[str, Dict[str, int]]]:
+        where, params = self._date_filter(start_date, end_date)
+        rows = self.connection.execute(
+            "SELECT date, calories, protein, carbs, fats FROM plans" + where + " ORDER BY id", params
+        )
+        for row in rows:
+            yield row[0], dict(zip(NUTRIENTS, row[1:]))
+
+    def page(self, cursor: int = None, page_size: int = 50, start_date: str = None,
+             end_date: str = None) -> Tuple[List[Tuple[str, Dict[str, int]]], Optional[int]]:
+        """Return one page of totals; the cursor is the last plan id returned."""
+        where, params = self._date_filter(start_date, end_date)
+        if cursor is not None:
+            where += (" AND" if where else " WHERE") + " id > ?"
+            params.append(cursor)
+        rows = self.connection.execute(
+            "SELECT id, date, calories, protein, carbs, fats FROM plans" + where
+            + " ORDER BY id LIMIT ?", params + [page_size + 1]
+        ).fetchall()
+        items = [(date, dict(zip(NUTRIENTS, totals))) for _, date, *totals in rows[:page_size]]
+        next_cursor = rows[page_size - 1][0] if len(rows) > page_size else None
+        return items, next_cursor
+
+    def iter_entries(self, start_date: str = None, end_date: str = None) -> Iterator[Dict]:
+        where, params = self._date_filter(start_date, end_date)
+        plans = self.connection.execute(
+            "SELECT id, date, calories, protein, carbs, fats FROM plans" + where + " ORDER BY id", params
+        )
+        for plan_id, date, *totals in plans:
+            meals = self.connection.execute(
+                "SELECT meal_number, foods, calories, protein, carbs, fats FROM meals"
+                " WHERE plan_id = ? ORDER BY meal_number", (plan_id,)
+            )
+            yield {
+                "date": date,
+                "summary": {
+                    "total_nutrition": dict(zip(NUTRIENTS, totals)),
+                    "meals": [
+                        {
+                            "meal_number": meal_number,
+                            "foods": json.loads(foods),
+                            "nutrition": dict(zip(NUTRIENTS, nutrition))
+                        }
+                        for meal_number, foods, *nutrition in meals
+                    ]
+                }
+            }
+
+    def import_csv(self, csv_path: str = "meal_history.csv") -> int:
+        """Copy every entry of a legacy CSV history file into this store.
+
+        Returns the number of imported plans.
+        """
+        entries = list(CSVHistoryBackend(csv_path).iter_entries())
+        self.append(entries)
+        return len(entries)
+
+    def close(self):
+        self.connection.close()
+
+class CompactHistoryBackend(HistoryBackend):
+    """Compact history that stores food IDs instead of summary JSON.
+
+    Rows are ``date<TAB>seed<TAB>meals``: ``meals`` holds ``;``-separated
+    meals of comma-separated food table indices and ``-`` marks an unknown
+    seed. Items of plans with scaled portions are written
+    ``index*servings``. ``!db <version>`` and ``!profile <fingerprint>``
+    lines apply to the rows after them and are written only when they
+    change. Summaries are rebuilt from ``food_table`` (an ``app.FoodTable``)
+    on read, which must have the version the rows were written with.
+    Entries that cannot be rebuilt exactly, such as foods missing from the
+    table, are kept as ``date<TAB>summary JSON`` rows.
+    """
+
+    def __init__(self, food_table, path: str = "meal_history.compact"):
+        self.food_table = food_table
+        self.path = path
+        # (name, portion) -> food ID, built on the first summary that needs encoding
+        self._food_ids = None
+        # Directives in force at the end of the file, and its size when read
+        self._db = None
+        self._profile = None
+        self._size = 0
+
+    def append(self, entries: List[Dict]):
+        self._load_tail()
+        lines = []
+        for entry in entries:
+            food_ids = entry.get("food_ids")
+            if food_ids is None:
+                food_ids = self._encode(entry["summary"])
+            if food_ids is None:
+                lines.append(f"{entry['date']}\t{json.dumps(entry['summary'])}\n")
+                continue
+            if self._db != self.food_table.version:
+                self._db = self.food_table.version
+                lines.append(f"!db {self._db}\n")
+            profile = entry.get("profile") or "-"
+            if profile != self._profile:
+                self._profile = profile
+                lines.append(f"!profile {profile}\n")
+            seed = entry.get("seed")
+            portions = entry.get("portions") if "food_ids" in entry else None
+            if portions is None:
+                meals = ";".join(",".join(map(str, meal)) for meal in food_ids)
+            else:
+                meals = ";".join(",".join(f"{i}*{servings!r}" for i, servings in zip(meal, meal_portions))
+                                 for meal, meal_portions in zip(food_ids, portions))
+            lines.append(f"{entry['date']}\t{'-' if seed is None else seed}\t{meals}\n")
+        data = "".join(lines).encode()
+        with open(self.path, 'ab') as file:
+            file.write(data)
+        self._size += len(data)
+
+    def _load_tail(self):
+        """Re-read the directives in force if the file changed since we last saw it."""
+        try:
+            size = os.path.getsize(self.path)
+        except FileNotFoundError:
+            size = 0
+        if size == self._size:
+            return
+        self._db = self._profile = None
+        for db, profile, _ in self._iter_rows():
+            self._db, self._profile = db, profile
+        self._size = size
+
+    def _encode(self, summary: Dict) -> Optional[List[List[int]]]:
+        """Return the food IDs of a summary, or None if they do not rebuild it exactly."""
+        if self._food_ids is None:
+            self._food_ids = {}
+            for i, key in enumerate(zip(self.food_table.names, self.food_table.portions)):
+                self._food_ids.setdefault(key, i)
+        try:
+            food_ids = [[self._food_ids[food["name"], food["portion"]] for food in meal["foods"]]
+                        for meal in summary["meals"]]
+        except (KeyError, TypeError):
+            return None
+        if self.food_table.summarize(food_ids) != summary:
+            return None
+        return food_ids
+
+    def _iter_rows(self, start_date: str = None, end_date: str = None) -> Iterator[Tuple[str, str, List[str]]]:
+        """Yield (db version, profile, fields) for every data row in a date range."""
+        db = profile = None
+        try:
+            file = open(self.path, 'r')
+        except FileNotFoundError:
+            return
+        with file:
+            for line in file:
+                line = line.rstrip("\n")
+                if line.startswith("!db "):
+                    db = line[4:]
+                elif line.startswith("!profile "):
+                    profile = line[9:]
+                elif line:
+                    fields = line.split("\t")
+                    if _in_range(fields[0], start_date, end_date):
+                        yield db, profile, fields
+
+    def _food_ids_of(self, db: str, date: str, meals: str) -> Tuple[List[List[int]], Optional[List[List[float]]]]:
+        """Parse a meals field into food IDs and, for scaled plans, portion multiples."""
+        if db != self.food_table.version:
+            raise ValueError(f"History row for {date} was written with food database {db}, "
+                             f"not {self.food_table.version}")
+        items = [meal.split(",") if meal else [] for meal in meals.split(";")]
+        food_ids = [[int(item.partition("*")[0]) for item in meal] for meal in items]
+        if "*" not in meals:
+            return food_ids, None
+        portions = [[float(item.partition("*")[2] or 1) for item in meal] for meal in items]
+        return food_ids, portions
+
+    def iter_entries(self, start_date: str = None, end_date: str = None) -> Iterator[Dict]:
+        for db, profile, fields in self._iter_rows(start_date, end_date):
+            if len(fields) == 2:
+                yield {"date": fields[0], "summary": json.loads(fields[1])}
+                continue
+            date, seed, meals = fields
+            food_ids, portions = self._food_ids_of(db, date, meals)
+            yield {
+                "date": date,
+                "summary": self.food_table.summarize(food_ids, portions),
+                "food_ids": food_ids,
+                "portions": portions,
+                "profile": None if profile == "-" else profile,
+                "seed": None if seed == "-" else int(seed)
+            }
+
+    def iter_totals(self, start_date: str = None, end_date: str = None) -> Iterator[Tuple[str, Dict[str, int]]]:
+        table = self.food_table
+        for db, _, fields in self._iter_rows(start_date, end_date):
+            if len(fields) == 2:
+                yield fields[0], json.loads(fields[1])["total_nutrition"]
+                continue
+            food_ids, portions = self._food_ids_of(db, fields[0], fields[2])
+            totals = table.meal_totals(food_ids, portions)
+            yield fields[0], table.rounded_nutrition(totals.sum(axis=0))
+
+    def sync(self):
+        _fsync(self.path)
+
+    def import_csv(self, csv_path: str = "meal_history.csv") -> int:
+        """Convert every entry of a legacy CSV history file into this store.
+
+        Returns the number of imported plans.
+        """
+        entries = list(CSVHistoryBackend(csv_path).iter_entries())
+        self.append(entries)
+        return len(entries)
+
+class NutritionRollups:
+    """Running per-day and per-ISO-week nutrition aggregates.
+
+    Each bucket keeps the plan count and the sum, min and max of every
+    macro. Buckets are updated incrementally from appended entries and the
+    whole store is persisted as a small JSON file, so trend queries cost
+    O(number of buckets) rather than a history scan. Updates hold a lock on
+    ``<path>.lock`` and start from the file as last saved, so several
+    instances and processes can share one store.
+    """
+
+    PERIODS = ("day", "week")
+
+    def __init__(self, path: str = "meal_rollups.json"):
+        self.path = path
+        self._lock = threading.RLock()
+        self._lock_depth = 0
+        self._buckets = {period: {} for period in self.PERIODS}
+        # Identity of the store file the buckets were read from or saved to
+        self._stamp = None
+        # False until a store file exists; callers may rebuild() from history
+        self.loaded = False
+        self._reload()
+
+    def _reload(self):
+        """Re-read the store file if it changed since it was last read or saved."""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return
+        stamp = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if stamp == self._stamp:
+            return
+        with open(self.path, 'r') as file:
+            stored = json.load(file)
+        self._buckets = {period: stored.get(period, {}) for period in self.PERIODS}
+        self._stamp = stamp
+        self.loaded = True
+
+    @contextmanager
+    def locked(self):
+        """Hold the store's thread and file locks, with the buckets read from the latest file.
+
+        Re-entrant within a thread, so a caller may keep the store locked
+        around its own history write and the ``update`` that follows it.
+        """
+        with self._lock:
+            if self._lock_depth:
+                self._lock_depth += 1
+                try:
+                    yield
+                finally:
+                    self._lock_depth -= 1
+                return
+            with open(self.path + ".lock", 'a') as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                self._lock_depth = 1
+                try:
+                    self._reload()
+                    yield
+                finally:
+                    self._lock_depth = 0
+                    if fcntl is not None:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @staticmethod
+    def path_for(history_path: str) -> str:
+        """Return the store path for a CSV history: ``meal_rollups.json`` beside the
+        default ``meal_history.csv``, else ``<history_path>.rollups.json``."""
+        directory, name = os.path.split(history_path)
+        if name == "meal_history.csv":
+            return os.path.join(directory, "meal_rollups.json")
+        return history_path + ".rollups.json"
+
+    @staticmethod
+    def week_key(date: str) -> str:
+        """Return the ISO week bucket (``YYYY-Www``) of a ``YYYY-MM-DD`` date."""
+        year, week, _ = Date.fromisoformat(date).isocalendar()
+        return f"{year:04d}-W{week:02d}"
+
+    def update(self, entries: List[Dict], save: bool = True):
+        """Fold history entries into their day and week buckets."""
+        with self.locked():
+            for entry in entries:
+                totals = entry["summary"]["total_nutrition"]
+                for period, key in (("day", entry["date"]), ("week", self.week_key(entry["date"]))):
+                    bucket = self._buckets[period].get(key)
+                    if bucket is None:
+                        bucket = {"count": 0}
+                        bucket.update({nutrient: [0, totals[nutrient], totals[nutrient]]
+                                       for nutrient in NUTRIENTS})
+                        self._buckets[period][key] = bucket
+                    bucket["count"] += 1
+                    for nutrient in NUTRIENTS:
+                        stats = bucket[nutrient]
+                        value = totals[nutrient]
+                        stats[0] += value
+                        stats[1] = min(stats[1], value)
+                        stats[2] = max(stats[2], value)
+            if save:
+                self._save()
+                self.loaded = True
+
+    def rebuild(self, backend: HistoryBackend):
+        """Recompute every bucket from a history backend."""
+        with self.locked():
+            self._buckets = {period: {} for period in self.PERIODS}
+            self.update([
+                {"date": date, "summary": {"total_nutrition": totals}}
+                for date, totals in backend.iter_totals()
+            ])
+
+    def query(self, period: str = "day", start_date: str = None, end_date: str = None) -> List[Dict]:
+        """Return the buckets of a period between two inclusive dates, oldest first.
+
+        Each row has the bucket key, the plan count and per-macro
+        ``sum``/``min``/``max``/``mean``.
+        """
+        if period not in self.PERIODS:
+            raise ValueError(f"Unknown rollup period: {period}")
+        if period == "week":
+            start_date = start_date and self.week_key(start_date)
+            end_date = end_date and self.week_key(end_date)
+        with self._lock:
+            # Saves are atomic replaces, so reading needs no file lock
+            self._reload()
+            buckets = [(key, bucket) for key, bucket in self._buckets[period].items()
+                       if _in_range(key, start_date, end_date)]
+            rows = []
+            for key, bucket in sorted(buckets):
+                row = {"bucket": key, "count": bucket["count"]}
+                for nutrient in NUTRIENTS:
+                    total, low, high = bucket[nutrient]
+                    row[nutrient] = {"sum": total, "min": low, "max": high,
+                                     "mean": total / bucket["count"]}
+                rows.append(row)
+        return rows
+
+    def _save(self):
+        temporary = self.path + ".tmp"
+        with open(temporary, 'w') as file:
+            json.dump(self._buckets, file)
+        os.replace(temporary, self.path)
+        stat = os.stat(self.path)
+        self._stamp = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+class RollupHistory(HistoryBackend):
+    """Backend wrapper that keeps a NutritionRollups store in step with appends.
+
+    A store that was never saved is rebuilt from the backend on the first
+    append or rollups access, not when the wrapper is created. The store
+    stays locked from each backend write until its rollup update is saved,
+    so other processes appending through their own RollupHistory never
+    count an entry twice or lose one.
+    """
+
+    def __init__(self, backend: HistoryBackend, rollups: NutritionRollups):
+        self.backend = backend
+        self._rollups = rollups
+
+    @property
+    def rollups(self) -> NutritionRollups:
+        with self._rollups.locked():
+            if not self._rollups.loaded:
+                self._rollups.rebuild(self.backend)
+        return self._rollups
+
+    def append(self, entries: List[Dict]):
+        with self._rollups.locked():
+            if not self._rollups.loaded:
+                self._rollups.rebuild(self.backend)
+            self.backend.append(entries)
+            self._rollups.update(entries)
+
+    def iter_entries(self, start_date: str = None, end_date: str = None) -> Iterator[Dict]:
+        return self.backend.iter_entries(start_date, end_date)
+
+    def iter_totals(self, start_date: str = None, end_date: str = None) -> Iterator[Tuple[str, Dict[str, int]]]:
+        return self.backend.iter_totals(start_date, end_date)
+
+    def page(self, cursor=None, page_size: int = 50, start_date: str = None, end_date: str = None):
+        return self.backend.page(cursor, page_size, start_date, end_date)
+
+    def sync(self):
+        self.backend.sync()
+
+    def close(self):
+        self.backend.close()
+
+class HistoryWriter(HistoryBackend):
+    """Group-commit front end that writes to another backend from a background thread.
+
+    ``append`` only enqueues; the writer thread is started by the first
+    one. It flushes a batch once it holds ``batch_size`` entries, its
+    oldest entry has waited ``max_delay`` seconds or ``flush`` is called,
+    calling the backend's ``sync`` afterwards when ``fsync`` is set.
+    Queued entries are flushed when the writer is closed, collected or at
+    interpreter exit; a failed write is re-raised by the next ``flush`` or
+    ``close``.
+    """
+
+    def __init__(self, backend: HistoryBackend, batch_size: int = 100,
+                 max_delay: float = 0.5, fsync: bool = False):
+        self.backend = backend
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.fsync = fsync
+        self._queue = queue.Queue()
+        self._closed = False
+        # Shared with the writer thread, which must not reference self
+        self._errors = []
+        self._threads = []
+        self._start_lock = threading.Lock()
+        self._finalizer = weakref.finalize(self, _stop_writer, self._queue, self._threads, backend)
+
+    def append(self, entries: List[Dict]):
+        if self._closed:
+            raise RuntimeError("HistoryWriter is closed")
+        if not self._threads:
+            self._start()
+        for entry in entries:
+            self._queue.put(entry)
+
+    def _start(self):
+        with self._start_lock:
+            if self._threads:
+                return
+            thread = threading.Thread(
+                target=_write_batches, name="history-writer", daemon=True,
+                args=(self.backend, self._queue, self._errors, self.batch_size,
+                      self.max_delay, self.fsync)
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def flush(self):
+        """Block until every queued entry has been written."""
+        if self._threads:
+            # Makes the writer write its partial batch instead of waiting for it to fill
+            self._queue.put(_FLUSH_WRITER)
+        self._queue.join()
+        self._raise_error()
+
+    def iter_entries(self, start_date: str = None, end_date: str = None) -> Iterator[Dict]:
+        self.flush()
+        return self.backend.iter_entries(start_date, end_date)
+
+    def iter_totals(self, start_date: str = None, end_date: str = None) -> Iterator[Tuple[str, Dict[str, int]]]:
+        self.flush()
+        return self.backend.iter_totals(start_date, end_date)
+
+    def page(self, cursor=None, page_size: int = 50, start_date: str = None, end_date: str = None):
+        self.flush()
+        return self.backend.page(cursor, page_size, start_date, end_date)
+
+    @property
+    def rollups(self) -> Optional[NutritionRollups]:
+        return self.backend.rollups
+
+    def sync(self):
+        self.flush()
+        self.backend.sync()
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self._finalizer()
+        self._raise_error()
+
+    def _raise_error(self):
+        if self._errors:
+            raise self._errors.pop()
+
+_STOP_WRITER = object()
+_FLUSH_WRITER = object()
+
+def _stop_writer(entries: queue.Queue, threads: List[threading.Thread], backend: HistoryBackend):
+    """Flush and stop a HistoryWriter's thread, if it was started, and close its backend."""
+    for thread in threads:
+        entries.put(_STOP_WRITER)
+        thread.join()
+    backend.close()
+
+def _write_batches(backend: HistoryBackend, entries: queue.Queue, errors: List[Exception],
+                   batch_size: int, max_delay: float, fsync: bool):
+    """Body of a HistoryWriter thread: append queued entries to backend in batches."""
+    stopping = False
+    while not stopping:
+        first = entries.get()
+        if first is _FLUSH_WRITER:
+            entries.task_done()
+            continue
+        if first is _STOP_WRITER:
+            entries.task_done()
+            break
+        batch = [first]
+        deadline = time.monotonic() + max_delay
+        while len(batch) < batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                entry = entries.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if entry is _FLUSH_WRITER:
+                entries.task_done()
+                break
+            if entry is _STOP_WRITER:
+                stopping = True
+                entries.task_done()
+                break
+            batch.append(entry)
+        try:
+            backend.append(batch)
+            if fsync:
+                backend.sync()
+        except Exception as e:
+            errors.append(e)
+        for _ in batch:
+            entries.task_done()
+
+def open_history(path: str, food_table=None) -> HistoryBackend:
+    """Open the history store at path, choosing its backend from the file extension.
+
+    ``.csv`` files keep their rollups beside them, ``.db`` files are SQLite
+    and ``.compact`` files need the planner's ``food_table``. Other
+    extensions raise ValueError.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".csv":
+        return RollupHistory(CSVHistoryBackend(path), NutritionRollups(NutritionRollups.path_for(path)))
+    if extension == ".db":
+        return SQLiteHistoryBackend(path)
+    if extension == ".compact" and food_table is not None:
+        return CompactHistoryBackend(food_table, path)
+    if extension == ".compact":
+        raise ValueError("A .compact history needs the planner's food table")
+    raise ValueError(f"Unknown history file type: {path} (expected .csv, .db or .compact)")
+
+def main():
+    import sys
+    if len(sys.argv) != 3:
+        print("usage: python history.py <meal_history.csv> <meal_history.db|meal_history.compact>")
+        sys.exit(2)
+    if sys.argv[2].endswith(".compact"):
+        # Compact rows are food table indices, so they need the planner's table
+        from app import DietPlanner
+        store = CompactHistoryBackend(DietPlanner(history=NullHistoryBackend()).food_table, sys.argv[2])
+    else:
+        store = SQLiteHistoryBackend(sys.argv[2])
+    count = store.import_csv(sys.argv[1])
+    store.close()
+    print(f"Imported {count} meal plans into {sys.argv[2]}")
+
+if __name__ == "__main__":
+    main()
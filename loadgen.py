@@ -0,0 +1,84 @@
+import argparse
+import asyncio
+import json
+import time
+from collections import Counter
+from typing import Dict, List
+import numpy as np
+
+SAMPLE_PROFILE = {
+    "weight": 70, "height": 175, "age": 30, "gender": "male",
+    "activity_level": "moderate", "goal": "maintain", "meals_per_day": 3,
+    "dietary_restrictions": [], "allergies": []
+}
+
+async def _client(host: str, port: int, request: bytes, count: int,
+                  latencies: List[float], statuses: Counter):
+    """Send ``count`` requests over one keep-alive connection."""
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for _ in range(count):
+            start = time.perf_counter()
+            writer.write(request)
+            await writer.drain()
+            status_line = await reader.readline()
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            await reader.readexactly(int(headers.get("content-length", 0)))
+            latencies.append(time.perf_counter() - start)
+            statuses[int(status_line.split()[1])] += 1
+    finally:
+        writer.close()
+
+def build_request(host: str, endpoint: str, mode: str) -> bytes:
+    if endpoint == "needs":
+        path, payload = "/needs", SAMPLE_PROFILE
+    else:
+        path, payload = "/plan", {"profile": SAMPLE_PROFILE, "mode": mode}
+    body = json.dumps(payload).encode()
+    head = (f"POST {path} HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n\r\n")
+    return head.encode("latin-1") + body
+
+async def run_load(host: str, port: int, endpoint: str, mode: str,
+                   requests: int, concurrency: int) -> Dict:
+    """Drive the server with ``concurrency`` connections and summarize the results."""
+    request = build_request(host, endpoint, mode)
+    latencies, statuses = [], Counter()
+    per_client = [requests // concurrency + (i < requests % concurrency) for i in range(concurrency)]
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        _client(host, port, request, count, latencies, statuses) for count in per_client if count
+    ))
+    elapsed = time.perf_counter() - start
+    latency_ms = np.array(latencies) * 1000
+    return {
+        "requests": len(latencies),
+        "seconds": round(elapsed, 3),
+        "requests_per_second": round(len(latencies) / elapsed, 1),
+        "latency_ms": {
+            f"p{q}": round(float(np.percentile(latency_ms, q)), 2) for q in (50, 95, 99)
+        },
+        "statuses": dict(statuses)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Local load generator for server.py")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--endpoint", choices=("plan", "needs"), default="plan")
+    parser.add_argument("--mode", choices=("random", "sample", "optimize"), default="random")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    args = parser.parse_args()
+    result = asyncio.run(run_load(args.host, args.port, args.endpoint, args.mode,
+                                  args.requests, args.concurrency))
+    print(json.dumps(result, indent=2))
+
+if __name__ == "__main__":
+    main()
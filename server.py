@@ -0,0 +1,309 @@
+import argparse
+import asyncio
+import json
+import math
+import multiprocessing
+import os
+import signal
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Tuple
+from urllib.parse import parse_qs, urlsplit
+import numpy as np
+from app import DietPlanner, UserProfile
+from history import HistoryWriter, NullHistoryBackend, open_history
+
+# Planner owned by each worker process, created once by _init_worker
+_worker_planner = None
+
+def _init_worker(food_source: str = None):
+    global _worker_planner
+    _worker_planner = DietPlanner(history=NullHistoryBackend(), food_source=food_source)
+
+def _plan_in_worker(profile_data: Dict, mode: str, time_budget: float, samples: int,
+                    scale_portions: bool = False) -> Tuple[List[List[int]], List[List[float]]]:
+    """Generate one plan in a worker process and return it as plain lists.
+
+    Returns the meals' index lists and their portion multiples, or None for
+    the latter unless ``scale_portions`` is set.
+    """
+    profile = UserProfile.from_dict(profile_data)
+    plan_args = dict(mode=mode, time_budget=time_budget, samples=samples)
+    if not scale_portions:
+        meal_plan = _worker_planner.generate_meal_plans([profile], **plan_args)[0]
+        return [meal.tolist() for meal in meal_plan], None
+    (meal_plan,), (portions,) = _worker_planner.generate_scaled_meal_plans([profile], **plan_args)
+    return [meal.tolist() for meal in meal_plan], [meal.tolist() for meal in portions]
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+class PlanningServer:
+    """Stdlib-only asyncio HTTP front end for DietPlanner.
+
+    Endpoints:
+        GET  /health             liveness and queue depth
+        POST /needs              daily needs for a profile JSON body
+        POST /plan               meal plan summary for ``{"profile": {...}, "mode": ...}``;
+                                 ``"scale_portions": true`` also fits each item's grams
+        GET  /history            a page of history totals (``start``, ``end``, ``cursor``, ``limit``)
+
+    Plan generation runs in a bounded process pool. At most ``max_pending``
+    plans may be queued or running; further plan requests get 503 with a
+    Retry-After header instead of waiting.
+    """
+
+    REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+               413: "Payload Too Large", 500: "Internal Server Error", 503: "Service Unavailable"}
+    MAX_BODY = 1 << 20
+    MAX_TIME_BUDGET = 2.0
+    MAX_SAMPLES = 100000
+    MAX_PAGE_SIZE = 1000
+
+    def __init__(self, planner: DietPlanner = None, workers: int = None, max_pending: int = 64,
+                 food_source: str = None):
+        self.planner = planner if planner is not None else DietPlanner(food_source=food_source)
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending
+        self.pending = 0
+        # Spawned workers do not inherit the parent's history writer thread
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker, initargs=(food_source,)
+        )
+        self.server = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8080):
+        self.server = await asyncio.start_server(self._handle_connection, host, port)
+        return self.server
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        self.planner.history.close()
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    request = await self._read_request(reader)
+                except HTTPError as e:
+                    # The rest of the stream cannot be trusted; answer and close
+                    self._write_response(writer, e.status, {"error": e.message}, False)
+                    await writer.drain()
+                    break
+                if request is None:
+                    break
+                method, target, headers, body = request
+                try:
+                    status, payload = await self._dispatch(method, target, body)
+                except HTTPError as e:
+                    status, payload = e.status, {"error": e.message}
+                except Exception as e:
+                    status, payload = 500, {"error": str(e)}
+                keep_alive = headers.get("connection", "").lower() != "close"
+                self._write_response(writer, status, payload, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _readline(reader: asyncio.StreamReader) -> bytes:
+        try:
+            return await reader.readline()
+        except ValueError:
+            # StreamReader's line length limit was exceeded
+            raise HTTPError(400, "Request line or header too long")
+
+    async def _read_request(self, reader: asyncio.StreamReader):
+        request_line = await self._readline(reader)
+        if not request_line:
+            return None
+        try:
+            method, target, _ = request_line.decode("latin-1").split()
+        except ValueError:
+            raise HTTPError(400, "Malformed request line")
+        headers = {}
+        while True:
+            line = await self._readline(reader)
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        try:
+            length = int(headers.get("content-length", 0))
+        except ValueError:
+            raise HTTPError(400, "Content-Length is not an integer")
+        if length < 0:
+            raise HTTPError(400, "Content-Length is negative")
+        if length > self.MAX_BODY:
+            raise HTTPError(413, "Request body too large")
+        body = await reader.readexactly(length) if length else b""
+        return method, target, headers, body
+
+    def _write_response(self, writer: asyncio.StreamWriter, status: int, payload: Dict, keep_alive: bool):
+        body = json.dumps(payload).encode()
+        headers = [
+            f"HTTP/1.1 {status} {self.REASONS.get(status, '')}",
+            "Content-Type: application/json",
+            f"Content-Length: {len(body)}",
+            f"Connection: {'keep-alive' if keep_alive else 'close'}",
+        ]
+        if status == 503:
+            headers.append("Retry-After: 1")
+        writer.write(("\r\n".join(headers) + "\r\n\r\n").encode("latin-1") + body)
+
+    async def _dispatch(self, method: str, target: str, body: bytes) -> Tuple[int, Dict]:
+        url = urlsplit(target)
+        routes = {
+            "/health": ("GET", self._health),
+            "/needs": ("POST", self._needs),
+            "/plan": ("POST", self._plan),
+            "/history": ("GET", self._history),
+        }
+        if url.path not in routes:
+            raise HTTPError(404, f"No route for {url.path}")
+        allowed, handler = routes[url.path]
+        if method != allowed:
+            raise HTTPError(405, f"{url.path} expects {allowed}")
+        if method == "POST":
+            try:
+                data = json.loads(body or b"{}")
+            except json.JSONDecodeError:
+                raise HTTPError(400, "Body is not valid JSON")
+            if not isinstance(data, dict):
+                raise HTTPError(400, "Body must be a JSON object")
+        else:
+            data = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        return 200, await handler(data)
+
+    @staticmethod
+    def _profile(data: Dict) -> UserProfile:
+        try:
+            return UserProfile.from_dict(data)
+        except ValueError as e:
+            raise HTTPError(400, str(e))
+
+    async def _health(self, data: Dict) -> Dict:
+        return {"status": "ok", "pending": self.pending, "max_pending": self.max_pending,
+                "workers": self.workers}
+
+    async def _needs(self, data: Dict) -> Dict:
+        return self.planner.calculate_daily_needs(self._profile(data))
+
+    async def _plan(self, data: Dict) -> Dict:
+        profile_data = data.get("profile", {})
+        if not isinstance(profile_data, dict):
+            raise HTTPError(400, "profile must be a JSON object")
+        profile = self._profile(profile_data)
+        mode = data.get("mode", "random")
+        scale_portions = data.get("scale_portions", False)
+        if not isinstance(scale_portions, bool):
+            raise HTTPError(400, "scale_portions must be true or false")
+        try:
+            time_budget = float(data.get("time_budget", 0.05))
+            samples = min(int(data.get("samples", 10000)), self.MAX_SAMPLES)
+            DietPlanner._check_mode(mode, samples)
+        except (TypeError, ValueError) as e:
+            raise HTTPError(400, str(e))
+        # NaN would never reach the solver's deadline
+        if not math.isfinite(time_budget) or time_budget <= 0:
+            raise HTTPError(400, "time_budget must be a positive number of seconds")
+        time_budget = min(time_budget, self.MAX_TIME_BUDGET)
+
+        # Backpressure: refuse rather than queue without bound
+        if self.pending >= self.max_pending:
+            raise HTTPError(503, "Planner is saturated, retry later")
+        self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            meal_plan, portions = await loop.run_in_executor(
+                self.executor, _plan_in_worker, profile_data, mode, time_budget, samples,
+                scale_portions
+            )
+        finally:
+            self.pending -= 1
+
+        meal_plan = [np.array(meal, dtype=np.intp) for meal in meal_plan]
+        if portions is not None:
+            portions = [np.array(meal, dtype=np.float64) for meal in portions]
+        self.planner.save_meal_plans_to_history(
+            [meal_plan], [profile], portions=None if portions is None else [portions]
+        )
+        return {
+            "daily_needs": self.planner.calculate_daily_needs(profile),
+            "summary": self.planner.get_meal_plan_summary(meal_plan, portions)
+        }
+
+    async def _history(self, data: Dict) -> Dict:
+        try:
+            limit = min(int(data.get("limit", 50)), self.MAX_PAGE_SIZE)
+            cursor = int(data["cursor"]) if "cursor" in data else None
+        except ValueError as e:
+            raise HTTPError(400, str(e))
+        if limit < 1:
+            raise HTTPError(400, "limit must be at least 1")
+        if cursor is not None and cursor < 0:
+            raise HTTPError(400, "cursor must not be negative")
+        # Reading may wait for queued writes and scan the history files
+        loop = asyncio.get_running_loop()
+        entries, next_cursor = await loop.run_in_executor(
+            None, self.planner.history.page, cursor, limit, data.get("start"), data.get("end")
+        )
+        return {
+            "entries": [{"date": date, "total_nutrition": totals} for date, totals in entries],
+            "next_cursor": next_cursor
+        }
+
+async def serve(host: str, port: int, workers: int, max_pending: int, food_source: str = None,
+                planner: DietPlanner = None):
+    planning_server = PlanningServer(planner=planner, workers=workers, max_pending=max_pending,
+                                     food_source=food_source)
+    server = await planning_server.start(host, port)
+    try:
+        # Stop cleanly on SIGTERM so queued history writes are flushed
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, server.close)
+    except NotImplementedError:
+        pass
+    print(f"Serving on http://{host}:{port} with {planning_server.workers} workers")
+    try:
+        await server.serve_forever()
+    except asyncio.CancelledError:
+        pass
+    finally:
+        await planning_server.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="AI Diet Planner HTTP service")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, help="planner processes (default: CPU count)")
+    parser.add_argument("--max-pending", type=int, default=64,
+                        help="plans queued or running before answering 503")
+    parser.add_argument("--foods", help="CSV or JSON food database; workers map its shared cache")
+    parser.add_argument("--history", help="history file to append plans to: .csv, .db for SQLite "
+                                          "or .compact (default: meal_history.csv)")
+    args = parser.parse_args()
+    planner = None
+    if args.history:
+        try:
+            planner = DietPlanner(history=NullHistoryBackend(), food_source=args.foods)
+            # Batched off the event loop, like the default history
+            planner.history = HistoryWriter(open_history(args.history, planner.food_table))
+        except (OSError, ValueError) as e:
+            parser.error(f"could not open history: {e}")
+    try:
+        asyncio.run(serve(args.host, args.port, args.workers, args.max_pending, args.foods, planner))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,499 @@
+import csv
+import io
+import itertools
+import json
+import os
+import re
+import time
+
+import numpy as np
+import pytest
+
+from app import (DietPlanner, FoodItem, FoodTable, KDTree, UserProfile, fit_portions,
+                 load_food_table, macro_deviation, read_food_source, solve_meal)
+from foodcache import CacheFormatError, read_columns
+from foodsearch import FoodSearchIndex
+from history import (CompactHistoryBackend, CSVHistoryBackend, HistoryBackend, HistoryWriter,
+                     NullHistoryBackend, NutritionRollups, RollupHistory)
+
+@pytest.fixture(scope="module")
+def planner():
+    return DietPlanner(history=NullHistoryBackend())
+
+def make_profile(weight, height, age, gender, activity_level, goal, restrictions=()):
+    profile = UserProfile()
+    profile.weight, profile.height, profile.age = weight, height, age
+    profile.gender, profile.activity_level, profile.goal = gender, activity_level, goal
+    profile.dietary_restrictions = list(restrictions)
+    return profile
+
+def test_batch_daily_needs_match_scalar(planner):
+    rng = np.random.default_rng(0)
+    profiles = [
+        make_profile(float(rng.uniform(40, 140)), float(rng.uniform(140, 210)),
+                     int(rng.integers(16, 90)), gender, activity, goal, restrictions)
+        for gender in ("male", "Female", "")
+        for activity in DietPlanner.ACTIVITY_LEVELS + ("unknown",)
+        for goal in DietPlanner.GOALS + ("unknown",)
+        for restrictions in ((), ("Vegan",), ("gluten-free",))
+    ]
+    batch = DietPlanner.calculate_daily_needs_batch(**DietPlanner.profile_columns(profiles))
+    for i, profile in enumerate(profiles):
+        expected = planner.calculate_daily_needs(profile)
+        assert {key: int(values[i]) for key, values in batch.items()} == expected
+
+def test_kdtree_matches_brute_force():
+    rng = np.random.default_rng(1)
+    points = rng.normal(size=(2000, 4)) * [400.0, 80.0, 120.0, 60.0]
+    ids = rng.permutation(len(points))
+    tree = KDTree(points, ids)
+
+    def even(candidates):
+        return candidates % 2 == 0
+
+    for point in rng.normal(size=(20, 4)) * [400.0, 80.0, 120.0, 60.0]:
+        distances = ((points - point) ** 2).sum(axis=1)
+        order = np.argsort(distances)
+        assert tree.query(point, 7).tolist() == ids[order[:7]].tolist()
+        allowed = order[even(ids[order])]
+        assert tree.query(point, 7, even).tolist() == ids[allowed[:7]].tolist()
+    assert len(tree.query(points[0], 0)) == 0
+
+def test_suggest_substitutes_for_no_items(planner):
+    assert len(planner.suggest_substitutes(0, 0)) == 0
+    assert len(planner.suggest_substitutes(0, -1)) == 0
+
+def test_fit_portions_satisfies_kkt_conditions():
+    rng = np.random.default_rng(2)
+    batch, items, regularization = 1000, 8, 0.01
+    per_portion = rng.uniform(0, 300, size=(batch, 4, items))
+    target = rng.uniform(100, 900, size=(batch, 4))
+    low = np.zeros((batch, items))
+    high = np.full((batch, items), 4.0)
+    # Some padded items held fixed
+    fixed = rng.random((batch, items)) < 0.2
+    low[fixed] = high[fixed] = 1.0
+    start = np.where(fixed, 1.0, rng.uniform(0, 4, size=(batch, items)))
+
+    x = fit_portions(per_portion, target, start, low, high, regularization)
+
+    assert np.all(x >= low - 1e-9) and np.all(x <= high + 1e-9)
+    assert np.all(x[fixed] == 1.0)
+    # Gradient of half the objective: scaled macro deviation plus the pull towards start
+    scale = 1.0 / np.maximum(target, 1.0)
+    weighted = per_portion * scale[:, :, None]
+    residual = (weighted @ x[:, :, None])[:, :, 0] - target * scale
+    gradient = (weighted.transpose(0, 2, 1) @ residual[:, :, None])[:, :, 0]
+    gradient += regularization * (x - start)
+    tolerance = 1e-6
+    at_low = ~fixed & (x <= low + 1e-9)
+    at_high = ~fixed & (x >= high - 1e-9)
+    free = ~fixed & ~at_low & ~at_high
+    assert np.all(np.abs(gradient[free]) < tolerance)
+    assert np.all(gradient[at_low] > -tolerance)
+    assert np.all(gradient[at_high] < tolerance)
+
+def test_solve_meal_finds_exact_optimum_on_small_input():
+    rng = np.random.default_rng(3)
+    slots = [(rng.uniform(0, 300, size=(6, 4)), rng.uniform(0, 0.1, size=6)) for _ in range(3)]
+    target = np.array([700.0, 50.0, 80.0, 25.0])
+    choice = solve_meal(slots, target, time.perf_counter() + 10)
+
+    def score(options):
+        totals = sum(slots[slot][0][option] for slot, option in enumerate(options))
+        return macro_deviation(totals, target) + sum(
+            slots[slot][1][option] for slot, option in enumerate(options))
+
+    best = min(itertools.product(range(6), repeat=3), key=score)
+    assert score(choice) == pytest.approx(score(best))
+
+def test_solve_meal_returns_by_deadline_on_large_input():
+    rng = np.random.default_rng(4)
+    slots = [(rng.uniform(0, 300, size=(2000, 4)), rng.uniform(0, 0.1, size=2000))
+             for _ in range(5)]
+    target = np.array([700.0, 50.0, 80.0, 25.0])
+    budget = 0.05
+    started = time.perf_counter()
+    choice = solve_meal(slots, target, started + budget)
+    elapsed = time.perf_counter() - started
+
+    assert len(choice) == len(slots)
+    assert all(0 <= option < 2000 for option in choice)
+    assert elapsed < budget + 0.25
+
+class ListHistoryBackend(HistoryBackend):
+    def __init__(self):
+        self.entries = []
+
+    def append(self, entries):
+        self.entries.extend(entries)
+
+    def iter_entries(self, start_date=None, end_date=None):
+        return iter(self.entries)
+
+def test_history_writer_flush_writes_partial_batch_at_once():
+    backend = ListHistoryBackend()
+    writer = HistoryWriter(backend, batch_size=100, max_delay=5.0)
+    for day in range(3):
+        writer.append([{"date": f"2026-01-0{day + 1}", "summary": {}}])
+        started = time.perf_counter()
+        writer.flush()
+        assert time.perf_counter() - started < 0.5
+        assert len(backend.entries) == day + 1
+    writer.close()
+
+def history_entry(date, calories, protein=50, carbs=100, fats=30):
+    totals = {"calories": calories, "protein": protein, "carbs": carbs, "fats": fats}
+    return {"date": date, "summary": {"total_nutrition": totals, "meals": []}}
+
+def test_rollups_shared_by_two_histories(tmp_path):
+    csv_path, rollups_path = str(tmp_path / "history.csv"), str(tmp_path / "rollups.json")
+    histories = [RollupHistory(CSVHistoryBackend(csv_path), NutritionRollups(rollups_path))
+                 for _ in range(2)]
+    for i in range(12):
+        histories[i % 2].append([history_entry(f"2026-03-{1 + i % 9:02d}", 1500 + i)])
+
+    fresh = NutritionRollups(str(tmp_path / "fresh.json"))
+    fresh.rebuild(CSVHistoryBackend(csv_path))
+    assert sum(row["count"] for row in fresh.query("day")) == 12
+    for history in histories:
+        assert history.rollups.query("day") == fresh.query("day")
+        assert history.rollups.query("week") == fresh.query("week")
+
+def totals_of(entries):
+    return [(entry["date"], entry["summary"]["total_nutrition"]) for entry in entries]
+
+def brute_force_range(entries, start_date, end_date):
+    return [(entry["date"], entry["summary"]["total_nutrition"]) for entry in entries
+            if (start_date is None or entry["date"] >= start_date)
+            and (end_date is None or entry["date"] <= end_date)]
+
+def read_all_pages(history, page_size, start_date=None, end_date=None):
+    items, cursor = [], None
+    while True:
+        page, cursor = history.page(cursor, page_size, start_date, end_date)
+        items.extend(page)
+        if cursor is None:
+            return items
+
+RANGES = [(None, None), ("2026-03-03", "2026-03-05"), ("2026-03-06", None),
+          (None, "2026-03-01"), ("2026-03-04", "2026-03-04"), ("2027-01-01", None)]
+
+def test_csv_history_range_reads_with_out_of_order_dates(tmp_path):
+    history = CSVHistoryBackend(str(tmp_path / "history.csv"))
+    entries = []
+    for day in range(1, 10):
+        # A week-long period plan, then single plans for days it already covered
+        batch = [history_entry(f"2026-03-{day + offset:02d}", 1000 * day + offset) for offset in range(7)]
+        batch += [history_entry(f"2026-03-{day:02d}", 1000 * day + 99)]
+        for entry in batch:
+            history.append([entry])
+        entries.extend(batch)
+
+    for start_date, end_date in RANGES:
+        expected = brute_force_range(entries, start_date, end_date)
+        assert totals_of(history.iter_entries(start_date, end_date)) == expected
+        assert read_all_pages(history, 4, start_date, end_date) == expected
+
+# Flags in several cases, and more of them than fit one 64-bit mask word
+FLAG_POOL = ["vegan", "Vegetarian", "GLUTEN-FREE", "dairy-free", "Keto"] + [f"Flag{i}" for i in range(70)]
+NAME_WORDS = ["almond", "almond milk", "oat", "Chicken", "rice", "Peanut", "soy", "MILK", "bread"]
+
+def synthetic_foods(count, seed):
+    rng = np.random.default_rng(seed)
+    foods = []
+    for i in range(count):
+        name = " ".join(rng.choice(NAME_WORDS, rng.integers(1, 4)))
+        flags = rng.choice(FLAG_POOL, rng.integers(0, 8), replace=False).tolist()
+        foods.append(FoodItem(f"{name} {i}", 100, 10.0, 10.0, 5.0, "snack", "100g", flags))
+    return foods
+
+def baseline_filter(foods, restrictions, allergies):
+    """The original list-comprehension filter_foods_by_restrictions."""
+    filtered_foods = foods.copy()
+    for restriction in restrictions:
+        filtered_foods = [
+            food for food in filtered_foods
+            if restriction.lower() in [flag.lower() for flag in food.dietary_flags]
+        ]
+    for allergen in allergies:
+        filtered_foods = [
+            food for food in filtered_foods
+            if allergen.lower() not in food.name.lower()
+        ]
+    return filtered_foods
+
+RESTRICTIONS = [[], ["vegan"], ["VEGAN"], ["Vegetarian", "gluten-free"], ["flag3", "Flag69"],
+                ["Vegan", "vegan"], ["unknown"], ["vegan", "unknown"], ["keto", "flag64", "DAIRY-FREE"]]
+
+def test_restriction_indices_match_baseline_filter():
+    foods = synthetic_foods(600, 5)
+    table = FoodTable(foods)
+    for restrictions in RESTRICTIONS:
+        expected = [food.name for food in baseline_filter(foods, restrictions, [])]
+        assert [foods[i].name for i in table.restriction_indices(restrictions)] == expected
+
+def test_filter_foods_by_restrictions_matches_baseline(planner):
+    profile = planner.user_profile
+    saved = profile.dietary_restrictions, profile.allergies
+    try:
+        for restrictions in [[], ["Vegan"], ["vegetarian"], ["gluten-free", "VEGAN"], ["unknown"]]:
+            profile.dietary_restrictions, profile.allergies = restrictions, ["Milk"]
+            foods = planner.food_database
+            assert (planner.filter_foods_by_restrictions(foods)
+                    == baseline_filter(foods, restrictions, ["Milk"]))
+    finally:
+        profile.dietary_restrictions, profile.allergies = saved
+
+ALLERGIES = [[], ["almond"], ["almond", "almond milk"], ["Almond Milk"], ["MILK", "milk"],
+             ["nd mi"], ["oat", "peanut", "soy"], ["zzz"], ["almond butter 0"], ["toasted almond"]]
+
+def test_allergen_free_indices_match_baseline_filter():
+    # Matches in the first and the last name of the table
+    foods = ([FoodItem("Almond Butter 0", 100, 10.0, 10.0, 5.0, "snack", "100g", [])]
+             + synthetic_foods(600, 6)
+             + [FoodItem("Toasted ALMOND", 100, 10.0, 10.0, 5.0, "snack", "100g", [])])
+    table = FoodTable(foods)
+    for allergies in ALLERGIES:
+        expected = [food.name for food in baseline_filter(foods, [], allergies)]
+        assert [foods[i].name for i in table.allergen_free_indices(allergies)] == expected
+        for restrictions in RESTRICTIONS[:4]:
+            expected = [food.name for food in baseline_filter(foods, restrictions, allergies)]
+            eligible = table.eligible_indices(restrictions, allergies)
+            assert [foods[i].name for i in eligible] == expected
+
+def csv_row(entry):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow([entry["date"], json.dumps(entry["summary"])])
+    return buffer.getvalue().encode()
+
+def check_ranges(histories, entries):
+    for history in histories:
+        for start_date, end_date in RANGES:
+            expected = brute_force_range(entries, start_date, end_date)
+            assert totals_of(history.iter_entries(start_date, end_date)) == expected
+            assert read_all_pages(history, 3, start_date, end_date) == expected
+
+def test_csv_history_index_catches_up_with_other_writers(tmp_path):
+    path = str(tmp_path / "history.csv")
+    first, second = CSVHistoryBackend(path), CSVHistoryBackend(path)
+    entries = []
+    for i in range(20):
+        entry = history_entry(f"2026-03-{1 + (i * 5) % 9:02d}", 2000 + i)
+        (first, second)[i % 2].append([entry])
+        entries.append(entry)
+        if i % 7 == 0:
+            check_ranges([first, second], entries)
+    check_ranges([first, second, CSVHistoryBackend(path)], entries)
+
+    # A writer that neither takes the lock nor updates the index
+    extra = [history_entry("2026-03-02", 3000), history_entry("2026-03-08", 3001)]
+    with open(path, 'ab') as file:
+        file.write(b"".join(csv_row(entry) for entry in extra))
+    entries.extend(extra)
+    check_ranges([first, second], entries)
+
+def test_csv_history_skips_partial_rows_until_complete(tmp_path):
+    path = str(tmp_path / "history.csv")
+    history = CSVHistoryBackend(path)
+    entries = [history_entry(f"2026-03-0{day}", 1000 + day) for day in (5, 2, 7)]
+    history.append(entries)
+    late = history_entry("2026-03-04", 4000)
+    row = csv_row(late)
+    with open(path, 'ab') as file:
+        file.write(row[:len(row) // 2])
+    check_ranges([history], entries)
+    with open(path, 'ab') as file:
+        file.write(row[len(row) // 2:])
+    check_ranges([history, CSVHistoryBackend(path)], entries + [late])
+
+def test_csv_history_reindexes_after_truncation(tmp_path):
+    path = str(tmp_path / "history.csv")
+    history = CSVHistoryBackend(path)
+    original = [history_entry(f"2026-03-0{1 + i % 9}", 1000 + i) for i in range(30)]
+    history.append(original)
+    check_ranges([history], original)
+
+    # Replaced with a shorter file by another program
+    replacement = [history_entry("2026-03-09", 5000), history_entry("2026-03-01", 5001)]
+    with open(path, 'wb') as file:
+        file.write(b"".join(csv_row(entry) for entry in replacement))
+    check_ranges([history], replacement)
+    more = [history_entry("2026-03-03", 5002)]
+    CSVHistoryBackend(path).append(more)
+    check_ranges([history], replacement + more)
+
+def profiles_for_history():
+    return [make_profile(60 + 10 * i, 165 + 5 * i, 25 + 10 * i, gender, "moderate", goal, restrictions)
+            for i, (gender, goal, restrictions) in enumerate([
+                ("male", "maintain", ()), ("female", "lose", ("vegan",)),
+                ("male", "gain", ()), ("female", "maintain", ("vegetarian",))])]
+
+def write_plans(planner, history):
+    """Append plain and scaled plans of several profiles through history; return the profiles."""
+    planner.history = history
+    profiles = profiles_for_history()
+    planner.generate_meal_plans(profiles, mode="sample", samples=200)
+    planner.generate_scaled_meal_plans(profiles, mode="sample", samples=200)
+    return profiles
+
+def test_compact_history_imports_csv_losslessly(tmp_path):
+    planner = DietPlanner(history=NullHistoryBackend())
+    planner.rng = np.random.default_rng(7)
+    csv_path = str(tmp_path / "history.csv")
+    write_plans(planner, CSVHistoryBackend(csv_path))
+    # A legacy row with a food the table no longer has
+    legacy = history_entry("2025-12-31", 1800)
+    legacy["summary"]["meals"] = [{"meal_number": 1, "nutrition": legacy["summary"]["total_nutrition"],
+                                   "foods": [{"name": "Retired Food", "portion": "1 cup"}]}]
+    with open(csv_path, 'ab') as file:
+        file.write(csv_row(legacy))
+    expected = list(CSVHistoryBackend(csv_path).iter_entries())
+
+    compact_path = str(tmp_path / "history.compact")
+    compact = CompactHistoryBackend(planner.food_table, compact_path)
+    assert compact.import_csv(csv_path) == len(expected) == 9
+    assert [entry["summary"] for entry in compact.iter_entries()] == [entry["summary"] for entry in expected]
+    assert list(compact.iter_totals()) == totals_of(expected)
+    with open(compact_path) as file:
+        rows = [line for line in file if not line.startswith("!")]
+    # Unscaled plans are stored as food IDs, not JSON
+    assert sum(not line.split("\t")[-1].startswith("{") for line in rows) >= 4
+
+def test_compact_history_keeps_scaled_portions(tmp_path):
+    planner = DietPlanner(history=NullHistoryBackend())
+    planner.rng = np.random.default_rng(8)
+    compact = CompactHistoryBackend(planner.food_table, str(tmp_path / "history.compact"))
+    profiles = write_plans(planner, compact)
+    # Plain plans of every profile, then the scaled ones
+    written = [profile.meal_history[plan] for plan in range(2) for profile in profiles]
+    entries = list(compact.iter_entries())
+    assert [entry["summary"] for entry in entries] == [entry["summary"] for entry in written]
+    assert [entry["food_ids"] for entry in entries] == [entry["food_ids"] for entry in written]
+    assert [entry["portions"] for entry in entries] == [entry["portions"] for entry in written]
+    assert all(entry["portions"] is not None for entry in entries[4:])
+
+def write_food_source(path, calories=100):
+    rows = ["name,calories,protein,carbs,fats,category,portion,dietary_flags"]
+    rows += [f"Food {i},{calories + i},{i % 30},{i % 50},{i % 20},cat{i % 4},100g,vegan;Flag{i % 70}"
+             for i in range(300)]
+    with open(path, 'w') as file:
+        file.write("\n".join(rows) + "\n")
+
+def table_contents(table):
+    return (list(table.names), table.nutrients.tolist(), table.categories,
+            table.restriction_indices(["vegan", "flag65"]).tolist())
+
+def replace_file(path, data):
+    # Replaced rather than rewritten in place, as tables from earlier loads still map the old file
+    with open(path + ".new", 'wb') as file:
+        file.write(data)
+    os.replace(path + ".new", path)
+
+def test_damaged_food_cache_is_rebuilt(tmp_path):
+    source = str(tmp_path / "foods.csv")
+    write_food_source(source)
+    expected = table_contents(FoodTable(read_food_source(source)))
+    assert table_contents(load_food_table(source)) == expected
+    cache = source + ".cache"
+    with open(cache, 'rb') as file:
+        good = file.read()
+
+    garbled_header = bytearray(good)
+    garbled_header[30:60] = b"#" * 30
+    bad_offset = good.replace(b'"offset": ', b'"offset": 9', 1)
+    damaged = [b"", good[:10], good[:100], good[:len(good) // 2], good[:-1],
+               bytes(garbled_header), bad_offset, b"NOTACACHE" + good[9:]]
+    for data in damaged:
+        replace_file(cache, data)
+        with pytest.raises(CacheFormatError):
+            read_columns(cache)
+        assert table_contents(load_food_table(source)) == expected
+        # The rebuilt cache is valid again
+        read_columns(cache)
+
+def test_stale_food_cache_is_rebuilt(tmp_path):
+    source = str(tmp_path / "foods.csv")
+    write_food_source(source)
+    load_food_table(source)
+    stat = os.stat(source)
+
+    # Same size, new contents and modification time
+    write_food_source(source, calories=200)
+    os.utime(source, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert os.stat(source).st_size == stat.st_size
+    expected = table_contents(FoodTable(read_food_source(source)))
+    assert table_contents(load_food_table(source)) == expected
+
+    # Same modification time, new size
+    write_food_source(source, calories=1000)
+    os.utime(source, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    expected = table_contents(FoodTable(read_food_source(source)))
+    assert table_contents(load_food_table(source)) == expected
+
+SEARCH_WORDS = ["almond", "almonds", "milk", "chicken", "breast", "brown", "rice", "broccoli",
+                "salmon", "atlantic", "oat", "oats", "bran", "bread", "whole", "wheat", "greek",
+                "yogurt", "peanut", "butter", "sweet", "potato", "potatoes", "egg", "eggs",
+                "white", "spinach", "tofu", "firm", "turkey", "ground", "lean", "beef", "cheese"]
+SEARCH_QUERIES = ["almond", "alm", "almnd", "almonds", "almond milk", "almond mil", "chiken",
+                  "chick bre", "brocoli", "rice brwn", "brown rice ", "potato", "potatos",
+                  "oat", "oat ", "egg whit", "b", "br", "greek yogurt", "yoghurt", "butter pea",
+                  "xyz", "tofu firm beef", "salmn atl", "whole wheat bread"]
+
+def levenshtein(a, b, prefix=False):
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1,
+                               previous[j - 1] + (char_a != char_b)))
+        previous = current
+    return min(previous) if prefix else previous[-1]
+
+def trigrams(word):
+    padded = f"^{word}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def brute_force_search(names, query, limit):
+    """Score every name word by word as FoodSearchIndex documents it."""
+    tokens = re.findall(r"\w+", query.lower())
+    partial = not query[-1].isspace()
+    results = []
+    for i, name in enumerate(names):
+        words = re.findall(r"\w+", name.lower())
+        total = 0
+        for number, token in enumerate(tokens):
+            prefix = partial and number == len(tokens) - 1
+            limit_distance = 1 if len(token) <= 5 else 2
+            best = 0
+            for word in words:
+                if word == token:
+                    best = max(best, FoodSearchIndex.EXACT)
+                elif prefix and word.startswith(token):
+                    best = max(best, FoodSearchIndex.PREFIX)
+                elif (len(token) >= 3 and trigrams(token) & trigrams(word)
+                      and levenshtein(token, word, prefix) <= limit_distance):
+                    best = max(best, FoodSearchIndex.FUZZY)
+            if not best:
+                break
+            total += best
+        else:
+            results.append((-total, len(name), i))
+    return [i for _, _, i in sorted(results)[:limit]]
+
+@pytest.mark.parametrize("dense_fraction", [None, 0.0, 2.0])
+def test_food_search_matches_brute_force(dense_fraction):
+    rng = np.random.default_rng(9)
+    names = [" ".join(rng.choice(SEARCH_WORDS, rng.integers(1, 5))).title() for _ in range(3000)]
+    index = FoodSearchIndex(names)
+    if dense_fraction is not None:
+        # Force the dense or the sparse scoring path
+        index.DENSE_FRACTION = dense_fraction
+    for query in SEARCH_QUERIES:
+        for limit in (1, 10, 200):
+            assert index.search(query, limit).tolist() == brute_force_search(names, query, limit), query
+
+def test_food_search_on_builtin_foods(planner):
+    names = planner.food_table.names
+    for query in ["almnd", "almond", "chicken breast", "chiken", "brocoli", "salmn", "oats"]:
+        assert planner.search_foods(query, 5).tolist() == brute_force_search(list(names), query, 5), query